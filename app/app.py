@@ -1,20 +1,26 @@
 import os
+import re
+import json
+import time
 import shutil
 from datetime import timedelta
-import time
 from dotenv import load_dotenv
 
-from flask import Flask, render_template, session, request, redirect, url_for, jsonify, send_file
+from flask import Flask, Response, render_template, session, request, redirect, url_for, jsonify
 from flask_session import Session
 from threading import Thread
 
 from auth import login, check_login, setup_oauth, authorized
 from facesheet import generate
-from logger import log_message, LOG_FILE
-from config import IS_PRODUCTION, BASE_URL, PORT, PARENT_FOLDER
-from sheet import list_google_sheets
-from datetime_helper import format_datetime
+from logger import log_message
+from config import IS_PRODUCTION, BASE_URL, PORT, PARENT_FOLDER, STARTUP_WARMUP, RENDER_RETRY_AFTER, JOB_STALE_SECONDS
+from sheet import list_google_sheets, get_sheet_listing
+from images_helper import image_index_status
 from core import app
+from startup import warm_up
+from jobs import JobQueue, load_job, read_job_events, FINAL_EVENTS, ACTIVE_STATUSES
+from metrics import render_metrics, reset_metrics
+from render_limiter import render_limiter
 
 # === Load environment variables ===
 if not IS_PRODUCTION:
@@ -40,12 +46,18 @@ Session(app)
 # === OAuth Setup ===
 setup_oauth(app)
 
+# === Warm-up ===
+if STARTUP_WARMUP:
+    warm_up()
+
+# === Background Jobs ===
+job_queue = JobQueue(generate)
+SHEET_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
 @app.route('/')
 def home():
     if 'email' in session:
         sheets = list_google_sheets()
-        for s in sheets:
-            s["modifiedTime"] = format_datetime(s["modifiedTime"])
         return render_template('home.html', email=session.get('email'), sheets=sheets, parent=PARENT_FOLDER)
     return redirect(url_for('login_page'))
 
@@ -84,36 +96,133 @@ def generate_route():
     if not sheet_id:
         return jsonify({"error": "Missing sheet_id"}), 400
 
-    if os.path.exists(LOG_FILE):
-        os.remove(LOG_FILE)
-
-    try:
-        log_message("Generation started...")
-        start_time = time.time()
-        result = generate(email, sheet_id)
-        end_time = time.time()
-        duration = round(end_time - start_time, 2)
-        log_message(f"🎉 All done in {duration} seconds! PDF Link: {result.get('pdf_link')}")
-        return jsonify({
-            "pdf_link": result.get("pdf_link"),
-            "duration": duration
-        })
-    except Exception as e:
-        log_message(f"❌ Error during generation: {e}")
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route('/logs')
-def get_logs():
-    if os.path.exists(LOG_FILE):
-        return send_file(LOG_FILE, mimetype='text/plain')
-    return "No logs available.", 404
+    if not SHEET_ID_PATTERN.match(sheet_id):
+        return jsonify({"error": "Invalid sheet_id"}), 400
+
+    force = bool(data.get("force"))
+    ticket = render_limiter.take_ticket()
+    if ticket is None:
+        log_message(f"🚦 Render queue full; asking {email} to retry in {RENDER_RETRY_AFTER}s.")
+        response = jsonify({"error": "Too many PDFs are being generated right now. Please try again shortly.",
+                            "retry_after": RENDER_RETRY_AFTER})
+        response.headers["Retry-After"] = str(RENDER_RETRY_AFTER)
+        return response, 429
+
+    job, coalesced = job_queue.submit(email, sheet_id, force=force, ticket=ticket)
+    return jsonify({
+        "job_id": job["job_id"],
+        "status": job["status"],
+        # Per-stage timings are only known as the job runs: see status_url or the done/error events.
+        "status_url": f"/jobs/{job['job_id']}",
+        "events_url": f"/jobs/{job['job_id']}/events",
+        "coalesced": coalesced
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    if not session.get("email"):
+        return jsonify({"error": "Not logged in"}), 403
+
+    job = load_job(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({
+        "job_id": job["job_id"],
+        "sheet_id": job["sheet_id"],
+        "status": job["status"],
+        "timings": job["timings"],
+        "pdf_link": job["pdf_link"],
+        "cached": job["cached"],
+        "duration": job["duration"],
+        "error": job["error"]
+    })
+
+def _closing_event(job_id):
+    """The final (event, data) for a stream whose job will never emit one itself, else None.
+
+    Covers a job that is gone, one whose worker died mid-run, and one that finished
+    without its final event reaching the stream.
+    """
+    job = load_job(job_id)
+    if job is None:
+        return "error", {"error": "This job is no longer known to the server."}
+    age = time.time() - job["updated_at"]
+    if job["status"] in ACTIVE_STATUSES:
+        if age > JOB_STALE_SECONDS:
+            return "error", {"error": "The worker running this job stopped responding. Please try again."}
+        return None
+    if age < 5:
+        return None  # The final event may still be on its way to the events file
+    if job["status"] == "done":
+        return "done", {"pdf_link": job["pdf_link"], "cached": job["cached"],
+                        "duration": job["duration"], "timings": job["timings"]}
+    return "error", {"error": job["error"], "duration": job["duration"], "timings": job["timings"]}
+
+@app.route('/jobs/<job_id>/events')
+def stream_job_events(job_id):
+    """Server-Sent Events stream of a job's progress, replaying everything since Last-Event-ID."""
+    if not session.get("email"):
+        return jsonify({"error": "Not logged in"}), 403
+    if not load_job(job_id):
+        return jsonify({"error": "Unknown job"}), 404
+
+    last_id = request.headers.get("Last-Event-ID", "0")
+    last_id = int(last_id) if last_id.isdigit() else 0
+
+    def events():
+        nonlocal last_id
+        offset = 0
+        idle_since = checked_at = time.monotonic()
+        while True:
+            new_events, offset = read_job_events(job_id, last_id, offset)
+            for event in new_events:
+                last_id = event["id"]
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                if event["event"] in FINAL_EVENTS:
+                    return
+                idle_since = time.monotonic()
+            if time.monotonic() - checked_at > 2:
+                # Don't hold a thread forever for a job whose worker died.
+                checked_at = time.monotonic()
+                closing = _closing_event(job_id)
+                if closing:
+                    yield f"event: {closing[0]}\ndata: {json.dumps(closing[1])}\n\n"
+                    return
+            if time.monotonic() - idle_since > 15:
+                yield ": keep-alive\n\n"
+                idle_since = time.monotonic()
+            time.sleep(0.25)
+
+    return Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
 
 @app.route("/sheets")
 def get_sheets():
-    return jsonify(list_google_sheets())
+    sheets, etag = get_sheet_listing()
+    response = jsonify(sheets)
+    if etag:
+        response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+@app.route("/metrics")
+def get_metrics():
+    body, content_type = render_metrics()
+    return Response(body, mimetype=content_type)
+
+@app.route("/render-queue")
+def get_render_queue_status():
+    return jsonify(render_limiter.status())
+
+@app.route("/image-index")
+def get_image_index_status():
+    return jsonify(image_index_status())
 
 # === Main Entry Point ===
 if __name__ == '__main__' and not IS_PRODUCTION:
+    reset_metrics()
     app.run(host='0.0.0.0', port=PORT, debug=True, threaded=True)
 
@@ -0,0 +1,242 @@
+import os
+import queue
+import atexit
+import threading
+import contextvars
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from playwright.sync_api import sync_playwright
+
+from logger import log_message
+from jobs import stage
+from config import BROWSER_POOL_SIZE, BROWSER_MAX_RENDERS, BROWSER_MAX_RSS_MB, BROWSER_RENDER_TIMEOUT
+
+CHROMIUM_ARGS = ["--no-sandbox", "--disable-dev-shm-usage"]
+
+def launch_browser(playwright):
+    """Launch a headless Chromium with the flags we use everywhere."""
+    with stage("chromium_launch"):
+        return playwright.chromium.launch(headless=True, args=CHROMIUM_ARGS)
+
+def _child_pids(pid):
+    children = []
+    task_dir = f"/proc/{pid}/task"
+    try:
+        for tid in os.listdir(task_dir):
+            with open(f"{task_dir}/{tid}/children") as f:
+                children.extend(int(c) for c in f.read().split())
+    except OSError:
+        pass
+    return children
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def browser_rss_mb(root_pid):
+    """Resident memory of root_pid and every process below it, e.g. one Playwright driver and its Chromium."""
+    total_kb = 0
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        total_kb += _rss_kb(pid)
+        pending.extend(_child_pids(pid))
+    return total_kb // 1024
+
+def _driver_pid(playwright):
+    """PID of the Node driver behind a sync_playwright() instance, or None if it cannot be found."""
+    try:
+        return playwright._impl_obj._connection._transport._proc.pid
+    except AttributeError:
+        return None  # Private API; only the render-count limit applies without it
+
+def _process_alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (OSError, IndexError):
+        return False
+
+
+class _BrowserWorker(threading.Thread):
+    """Owns one Playwright driver and one Chromium; Playwright's sync API is bound to the thread that started it."""
+
+    def __init__(self, pool, index):
+        super().__init__(name=f"browser-pool-{index}", daemon=True)
+        self.pool = pool
+        self.playwright = None
+        self.browser = None
+        self.renders = 0
+        self.driver_pid = None
+
+    def _start_driver(self):
+        if self.playwright is not None:
+            log_message(f"⚠️ [{self.name}] Playwright driver is gone, restarting it.")
+            self._stop_driver()
+        self.playwright = sync_playwright().start()
+        self.driver_pid = _driver_pid(self.playwright)
+        if self.driver_pid is None:
+            log_message(f"⚠️ [{self.name}] Could not find the Playwright driver process; browser RSS is not checked.")
+
+    def _stop_driver(self):
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except Exception:
+                pass
+            self.browser = None
+        try:
+            self.playwright.stop()
+        except Exception as e:
+            log_message(f"⚠️ [{self.name}] Error stopping the Playwright driver: {e}")
+        self.playwright = None
+        self.driver_pid = None
+
+    def _driver_alive(self):
+        if self.playwright is None:
+            return False
+        # Without the driver PID a dead driver still shows up as browser errors, which _with_retries handles
+        return self.driver_pid is None or _process_alive(self.driver_pid)
+
+    def _ensure_browser(self):
+        if not self._driver_alive():
+            self._start_driver()
+        if self.browser is not None and not self.browser.is_connected():
+            log_message(f"⚠️ [{self.name}] Browser disconnected, relaunching.")
+            self.browser = None
+        if self.browser is None:
+            self.browser = launch_browser(self.playwright)
+            self.renders = 0
+            log_message(f"🌐 [{self.name}] Chromium launched.")
+        return self.browser
+
+    def _recycle(self, reason):
+        log_message(f"♻️ [{self.name}] Recycling Chromium ({reason}).")
+        try:
+            self.browser.close()
+        except Exception as e:
+            log_message(f"⚠️ [{self.name}] Error closing browser: {e}")
+        self.browser = None
+
+    def _after_render(self):
+        self.renders += 1
+        if self.renders >= self.pool.max_renders:
+            self._recycle(f"{self.renders} renders")
+            return
+        if self.driver_pid is None:
+            return
+        # Only this worker's driver and Chromium: other pooled browsers do not count against it.
+        rss = browser_rss_mb(self.driver_pid)
+        if rss > self.pool.max_rss_mb:
+            self._recycle(f"browser RSS {rss} MB > {self.pool.max_rss_mb} MB")
+
+    def _render(self, fn, future):
+        context = None
+        try:
+            context = self._ensure_browser().new_context()
+            future.set_result(fn(context))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            if context is not None:
+                try:
+                    context.close()
+                except Exception:
+                    pass
+            if self.browser is not None:
+                self._after_render()
+
+    def run(self):
+        try:
+            while True:
+                item = self.pool.jobs.get()
+                if item is None:
+                    break
+                caller_context, fn, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                # Run in the caller's context (current job, log sink) so launches and logs are attributed to it.
+                caller_context.run(self._render, fn, future)
+        finally:
+            if self.playwright is not None:
+                self._stop_driver()
+            self.pool._worker_exited(self)
+
+
+class BrowserPool:
+    """A per-process pool of warm Chromium browsers handing out a fresh context per job."""
+
+    def __init__(self, size=BROWSER_POOL_SIZE, max_renders=BROWSER_MAX_RENDERS, max_rss_mb=BROWSER_MAX_RSS_MB,
+                 render_timeout=BROWSER_RENDER_TIMEOUT):
+        self.size = max(1, size)
+        self.max_renders = max(1, max_renders)
+        self.max_rss_mb = max_rss_mb
+        self.render_timeout = render_timeout
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.workers = [_BrowserWorker(self, i) for i in range(self.size)]
+        self.live_workers = len(self.workers)
+        for w in self.workers:
+            w.start()
+
+    def submit(self, fn):
+        """Queue fn(context) for the next free pooled browser and return a Future for its result."""
+        future = Future()
+        with self.lock:
+            if not self.live_workers:
+                future.set_exception(RuntimeError("Browser pool has no running workers"))
+                return future
+            self.jobs.put((contextvars.copy_context(), fn, future))
+        return future
+
+    def result(self, future):
+        """Wait for a submitted render, giving up after render_timeout seconds."""
+        try:
+            return future.result(timeout=self.render_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Pooled PDF render did not finish within {self.render_timeout}s") from None
+
+    def run(self, fn):
+        """Run fn(context) on a pooled browser and return its result."""
+        return self.result(self.submit(fn))
+
+    def _worker_exited(self, worker):
+        # Once the last worker is gone nothing will take queued renders: fail them instead of leaving callers waiting
+        with self.lock:
+            self.live_workers -= 1
+            if self.live_workers:
+                return
+            while True:
+                try:
+                    item = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None and item[2].set_running_or_notify_cancel():
+                    item[2].set_exception(RuntimeError("Browser pool stopped before this render ran"))
+
+    def shutdown(self):
+        for _ in self.workers:
+            self.jobs.put(None)
+        for w in self.workers:
+            w.join(timeout=10)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_browser_pool():
+    """Return this process's browser pool, starting it on first use (after any gunicorn fork)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.shutdown)
+            log_message(f"🏊 Browser pool started with {_pool.size} browser(s).")
+        return _pool
@@ -1,12 +1,87 @@
 import os
+import tempfile
+from dotenv import load_dotenv
 
 # Environment info
+# .env is loaded here, before any module reads its settings, and never in production.
+if os.getenv("ENVIRONMENT", "development") != "production":
+    load_dotenv()
+
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 IS_PRODUCTION = ENVIRONMENT == "production"
 
 PARENT_FOLDER = os.getenv("PARENT_FOLDER")
 TEMPLATE_DIR = "templates"
 IMAGE_DRIVE_FOLDER_ID = os.getenv("IMAGE_DRIVE_FOLDER_ID")
+# Where headshots are fetched from; {file_id} is the Drive file id (benchmarks point this at a local server)
+IMAGE_URL_TEMPLATE = os.getenv("IMAGE_URL_TEMPLATE", "https://lh3.googleusercontent.com/d/{file_id}=s750?authuser=0")
+
+# Parse discovery documents etc. at import time (once in the master with gunicorn --preload)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
 
 PORT = int(os.getenv("PORT", 8080))
 BASE_URL = os.getenv("BASE_URL") if IS_PRODUCTION else f"http://localhost:{PORT}"
+
+# PDF rendering
+PDF_RENDER_MODE = os.getenv("PDF_RENDER_MODE", "pool")  # "pool" or "oneshot"
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", 2))
+BROWSER_MAX_RENDERS = int(os.getenv("BROWSER_MAX_RENDERS", 50))
+BROWSER_MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", 1024))
+BROWSER_RENDER_TIMEOUT = int(os.getenv("BROWSER_RENDER_TIMEOUT", 600))
+PDF_SPOOL_THRESHOLD_MB = int(os.getenv("PDF_SPOOL_THRESHOLD_MB", 32))
+SIMPLE_UPLOAD_MAX_MB = int(os.getenv("SIMPLE_UPLOAD_MAX_MB", 5))
+PDF_RENDER_ATTEMPTS = int(os.getenv("PDF_RENDER_ATTEMPTS", 2))
+PDF_CHUNK_PEOPLE = int(os.getenv("PDF_CHUNK_PEOPLE", 400))  # people per parallel PDF batch; 0 renders in one go
+
+# Fonts for the native (browser-free) PDF engine; the fallback covers glyphs the main font lacks (e.g. CJK)
+NATIVE_PDF_FONT = os.getenv("NATIVE_PDF_FONT", "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf")
+NATIVE_PDF_FONT_BOLD = os.getenv("NATIVE_PDF_FONT_BOLD", "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf")
+NATIVE_PDF_FALLBACK_FONT = os.getenv("NATIVE_PDF_FALLBACK_FONT", "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc")
+IMAGE_WAIT_DEADLINE_MS = int(os.getenv("IMAGE_WAIT_DEADLINE_MS", 20000))
+IMAGE_WAIT_PER_IMAGE_MS = int(os.getenv("IMAGE_WAIT_PER_IMAGE_MS", 10000))
+IMAGE_PREFETCH_WORKERS = int(os.getenv("IMAGE_PREFETCH_WORKERS", 16))
+IMAGE_PREFETCH_TIMEOUT = int(os.getenv("IMAGE_PREFETCH_TIMEOUT", 15))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "facesheet-image-cache"))
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", 512))
+IMAGE_INDEX_TTL = int(os.getenv("IMAGE_INDEX_TTL", 3600))
+IMAGE_INDEX_POLL_SECONDS = int(os.getenv("IMAGE_INDEX_POLL_SECONDS", 5))
+IMAGE_INDEX_RETRY_SECONDS = int(os.getenv("IMAGE_INDEX_RETRY_SECONDS", 60))  # after a failed Drive sync, keep the old index this long
+
+# Background jobs
+STATE_DIR = os.getenv("STATE_DIR", os.path.join(tempfile.gettempdir(), "facesheet-state"))
+JOB_DIR = os.path.join(STATE_DIR, "jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 900))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 3600))  # finished jobs' files are pruned after this
+RENDER_CACHE_DIR = os.path.join(STATE_DIR, "render-cache")
+FRAGMENT_CACHE_DIR = os.path.join(STATE_DIR, "fragment-cache")
+FRAGMENT_CACHE_MAX_MB = int(os.getenv("FRAGMENT_CACHE_MAX_MB", 256))  # 0 disables per-category fragments
+TEMPLATE_CACHE_DIR = os.path.join(STATE_DIR, "jinja-cache")
+HTML_SPOOL_THRESHOLD_MB = int(os.getenv("HTML_SPOOL_THRESHOLD_MB", 32))
+
+# Render admission control, shared by all workers on the instance
+RENDER_LIMITER_DIR = os.path.join(STATE_DIR, "render-limiter")
+RENDER_SLOTS = int(os.getenv("RENDER_SLOTS", 2))
+RENDER_QUEUE_MAX = int(os.getenv("RENDER_QUEUE_MAX", 12))
+RENDER_WAIT_TIMEOUT = int(os.getenv("RENDER_WAIT_TIMEOUT", 240))
+RENDER_MIN_FREE_MB = int(os.getenv("RENDER_MIN_FREE_MB", 512))
+RENDER_RETRY_AFTER = int(os.getenv("RENDER_RETRY_AFTER", 15))
+
+# Metrics (Prometheus multiprocess samples, one file set per worker)
+METRICS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", os.path.join(STATE_DIR, "metrics"))
+
+# Logging
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 200))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 0.2))
+LOG_MAX_MB = int(os.getenv("LOG_MAX_MB", 20))  # log.jsonl is rotated to log.jsonl.1 past this size
+
+# Sheet data source: "google", or "local:<dir>" to read <dir>/<sheet_id>.json fixtures offline
+SHEET_READER = os.getenv("SHEET_READER", "google")
+
+# Login access checks against the parent folder's permissions
+ACCESS_ALLOW_TTL = int(os.getenv("ACCESS_ALLOW_TTL", 600))
+ACCESS_DENY_TTL = int(os.getenv("ACCESS_DENY_TTL", 60))
+
+# Sheet listing cache for the home page and /sheets
+SHEET_LIST_TTL = int(os.getenv("SHEET_LIST_TTL", 30))
+SHEET_LIST_MAX_AGE = int(os.getenv("SHEET_LIST_MAX_AGE", 600))
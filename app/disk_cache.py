@@ -0,0 +1,99 @@
+import os
+import fcntl
+import hashlib
+import tempfile
+import threading
+
+from logger import log_message
+from metrics import CACHE_HITS, CACHE_MISSES
+
+class DiskCache:
+    """On-disk cache of files keyed by id + content version, shared by every worker.
+
+    Writes go to a temp file and are renamed into place, so readers never see partial
+    files. A file's mtime is its last use; the least recently used files are evicted
+    once the cache passes its size cap.
+    """
+
+    def __init__(self, directory, max_bytes, name):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.name = name
+        self._lock = threading.Lock()
+        self._written_since_sweep = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key, version, ext):
+        digest = hashlib.sha256(f"{key}:{version}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}{ext.lower()}")
+
+    def get(self, key, version, ext):
+        """Return the cached path for this version, or None."""
+        path = self._path(key, version, ext)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            CACHE_MISSES.labels(cache=self.name).inc()
+            return None
+        CACHE_HITS.labels(cache=self.name).inc()
+        return path
+
+    def put(self, key, version, ext, data):
+        """Atomically store bytes for this version and return the cached path."""
+        path = self._path(key, version, ext)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            if self._written_since_sweep is not None:
+                self._written_since_sweep += len(data)
+            sweep = self._written_since_sweep is None or self._written_since_sweep > self.max_bytes // 20
+            if sweep:
+                self._written_since_sweep = 0
+        if sweep:
+            self.evict()
+        return path
+
+    def evict(self):
+        """Remove least recently used files until the cache fits its size cap."""
+        lock_path = os.path.join(self.directory, ".evict.lock")
+        with open(lock_path, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # Another worker is already sweeping
+
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+
+            if removed:
+                log_message(f"🧹 {self.name.capitalize()} cache evicted {removed} files ({total // (1024 * 1024)} MB kept).")
@@ -0,0 +1,24 @@
+def get_start_page_token(drive_service):
+    """Return the Drive changes feed token for 'now'."""
+    response = drive_service.changes().getStartPageToken(supportsAllDrives=True).execute()
+    return response['startPageToken']
+
+def list_changes(drive_service, page_token, file_fields="id, name, parents, trashed, mimeType"):
+    """Follow the Drive changes feed from page_token.
+
+    Returns (changes, new_start_page_token); save the token for the next call.
+    """
+    changes = []
+    while True:
+        response = drive_service.changes().list(
+            pageToken=page_token,
+            fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({file_fields}))",
+            pageSize=1000,
+            includeItemsFromAllDrives=True,
+            supportsAllDrives=True
+        ).execute()
+        changes.extend(response.get('changes', []))
+
+        if 'newStartPageToken' in response:
+            return changes, response['newStartPageToken']
+        page_token = response['nextPageToken']
@@ -1,18 +1,24 @@
 import os
 import sys
 import json
+import tempfile
 
 from dotenv import load_dotenv
-from jinja2 import Environment, FileSystemLoader
 
-from pdf import convert_html_to_pdf
-from logger import log_message
-from config import IS_PRODUCTION, PARENT_FOLDER, TEMPLATE_DIR
-from google_auth_helper import get_sheet
-from images_helper import initialize_image_index, check_image_exists
+from pdf import convert_html_to_pdf, convert_html_chunks_to_pdf, render_html_batches, merge_pdfs
+from pdf_fragments import plan_fragments, store_fragment, split_fragments, FRAGMENT_MARKER
+from native_pdf import render_native_pdf
+from template_helper import render_facesheet, chunk_categories
+from config import IS_PRODUCTION, PARENT_FOLDER, PDF_SPOOL_THRESHOLD_MB, PDF_CHUNK_PEOPLE, FRAGMENT_CACHE_MAX_MB
+from sheet_reader import get_sheet_reader
+from images_helper import ensure_image_index
+from generation_context import GenerationContext
+from image_prefetch import prefetch_images
 from sheet import fetch_pdf_config_settings, generate_grouped_people
 from core import app
+from jobs import stage
 from upload_delete import upload_or_replace_file
+from render_cache import load_render_record, quick_cached_render, cached_render, compute_fingerprint, save_render_record
 
 # === Environment Setup ===
 if not IS_PRODUCTION:
@@ -26,44 +32,186 @@ def return_response(payload):
         print("🛠️  [END OUTPUT]\n")
     return payload
 
-# === Main Workflow ===
-def generate(email, sheet_id):
-    log_message(f"👤 Starting generation for {email} using sheet ID: {sheet_id}")
-    try:
-        sheet = get_sheet(sheet_id)
-        log_message(f"📄 Using Google Sheet: '{sheet.title}'")
-
-        OUTPUT_HTML = f"{sheet.title}.html"
-        OUTPUT_PDF = f"{sheet.title}.pdf"
-
-        settings_data, size, top, bottom, logo_name = fetch_pdf_config_settings(sheet)
-        log_message("⚙️ PDF Config settings fetched.")
-        
-        initialize_image_index(PARENT_FOLDER)
-
-        grouped_people = generate_grouped_people(sheet)
-        log_message(f"🧑‍🤝‍🧑 Grouped data for {len(grouped_people)} groups.")
+# === PDF building ===
+def _render_html(ctx, grouped_people, logo_path, show_header, fragment_marker=None):
+    return ctx.keep(render_facesheet(
+        settings_data=ctx.settings,
+        grouped_people=grouped_people,
+        email=ctx.email,
+        logo_path=logo_path,
+        show_header=show_header,
+        fragment_marker=fragment_marker
+    ))
+
+def _log_html(ctx, htmls):
+    html_size = sum(html.size for html in htmls)
+    spooled = any(html.path for html in htmls)
+    ctx.log(f"✍️ HTML rendered ({html_size // 1024} KB in {len(htmls)} batch(es){', spooled to disk' if spooled else ''}).")
+
+def _build_in_batches(ctx, grouped_people, logo_path, page, out):
+    """Render the whole roster; large rosters go as parallel batches of whole categories."""
+    with stage("image_prefetch"):
+        logo_path = prefetch_images(ctx, grouped_people, logo_path)
+
+    # The title and logo go in the first batch only.
+    with stage("template_render"):
+        htmls = [
+            _render_html(ctx, chunk, logo_path, show_header=(i == 0))
+            for i, chunk in enumerate(chunk_categories(grouped_people, PDF_CHUNK_PEOPLE))
+        ]
+    _log_html(ctx, htmls)
+
+    ctx.log("🚧 Starting PDF generation...")
+    with stage("pdf_render"):
+        if len(htmls) == 1:
+            out.write(convert_html_to_pdf(htmls[0], *page, ctx=ctx))
+        else:
+            convert_html_chunks_to_pdf(htmls, *page, out, ctx=ctx)
+    for html in htmls:
+        html.close()
+
+def _build_from_fragments(ctx, grouped_people, logo_name, logo_path, page, out):
+    """Re-render only the categories whose fragment is not cached, then join all fragments.
+
+    Stale categories are rendered together in batches of about PDF_CHUNK_PEOPLE and each
+    batch PDF is split back into categories at their markers.
+    """
+    with stage("fragment_lookup"):
+        fragments = plan_fragments(grouped_people, ctx.settings, list(page), logo_name, ctx.image_index)
+    stale = [f for f in fragments if f.pdf is None]
+    ctx.log(f"🧩 {len(fragments) - len(stale)}/{len(fragments)} categories unchanged; rendering {len(stale)}.")
+
+    if stale:
+        header_stale = stale[0].header
+        with stage("image_prefetch"):
+            logo_path = prefetch_images(ctx, {f.category: f.people for f in stale}, logo_path if header_stale else None)
+
+        # The header fragment, when stale, is always first in the first batch.
+        by_category = {f.category: f for f in stale}
+        batches = [
+            [by_category[category] for category in chunk]
+            for chunk in chunk_categories({f.category: f.people for f in stale}, PDF_CHUNK_PEOPLE)
+        ]
+        unsplit = _render_fragment_batches(ctx, batches, logo_path, page)
+        if unsplit:
+            ctx.log(f"⚠️ Could not split {len(unsplit)} categories out of their batch; rendering them one by one.")
+            _render_fragment_batches(ctx, [[f] for f in unsplit], logo_path, page)
+
+    pages = merge_pdfs([f.pdf for f in fragments], out)
+    ctx.log(f"📚 Assembled {pages} pages from {len(fragments)} category fragments.")
+
+def _render_fragment_batches(ctx, batches, logo_path, page):
+    """Render batches of fragments and store each fragment's pages; returns fragments that could not be split."""
+    with stage("template_render"):
+        htmls = [
+            _render_html(ctx, {f.category: f.people for f in batch}, logo_path,
+                         show_header=batch[0].header,
+                         fragment_marker=FRAGMENT_MARKER if len(batch) > 1 else None)
+            for batch in batches
+        ]
+    _log_html(ctx, htmls)
+
+    ctx.log("🚧 Starting PDF generation...")
+    unsplit = []
+    with stage("pdf_render"):
+        for batch, pdf_bytes in zip(batches, render_html_batches(htmls, *page, ctx=ctx)):
+            if len(batch) == 1:
+                parts = [pdf_bytes]
+            else:
+                with stage("pdf_split"):
+                    parts = split_fragments(pdf_bytes, len(batch))
+            if parts is None:
+                unsplit.extend(batch)
+                continue
+            for fragment, part in zip(batch, parts):
+                store_fragment(fragment, part, logo_path)
+    for html in htmls:
+        html.close()
+    return unsplit
+
+def _build_native(ctx, grouped_people, logo_path, page, out):
+    """Draw the card grid straight to PDF with the native engine; no browser involved."""
+    with stage("image_prefetch"):
+        logo_path = prefetch_images(ctx, grouped_people, logo_path)
+
+    ctx.log("🚧 Starting PDF generation (native engine)...")
+    with stage("pdf_render"):
+        render_native_pdf(ctx.settings, grouped_people, logo_path, *page, out, log=ctx.log)
 
-        logo_path = check_image_exists(logo_name)
-        log_message(f"🖼️ Logo path: {logo_path}")
-
-        env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
-        tpl = env.get_template("facesheet.html")
-        html = tpl.render(
-            settings_data=settings_data,
-            grouped_people=grouped_people,
-            email=email,
-            logo_path=logo_path
-        )
-
-        with open(OUTPUT_HTML, 'w', encoding='utf-8') as f:
-            f.write(html)
-        log_message(f"✍️ HTML written to: {OUTPUT_HTML}")
+# === Main Workflow ===
+def generate(email, sheet_id, force=False):
+    """Build and upload one sheet's facesheet; safe to run on many threads at once.
 
-        log_message("🚧 Starting PDF generation...")
-        convert_html_to_pdf(OUTPUT_HTML, OUTPUT_PDF, size, top, bottom)
+    All per-run state lives on a GenerationContext; the image index, template
+    environment, browser pool and caches are shared read-only.
+    """
+    with GenerationContext(email, sheet_id, force) as ctx:
+        return _generate(ctx)
 
-        file_id, file_link = upload_or_replace_file(OUTPUT_PDF, OUTPUT_PDF, PARENT_FOLDER)
+def _generate(ctx):
+    ctx.log(f"👤 Starting generation for {ctx.email} using sheet ID: {ctx.sheet_id}")
+    try:
+        with stage("image_index"):
+            ensure_image_index(PARENT_FOLDER)
+            image_index = ctx.refresh_image_index()
+
+        reader = get_sheet_reader()
+
+        with stage("sheet_metadata"):
+            ctx.sheet = reader.read_metadata(ctx.sheet_id)
+            modified_time = ctx.sheet.modified_time
+            cached = None if ctx.force else quick_cached_render(ctx.sheet_id, modified_time, image_index)
+        if cached:
+            ctx.log("♻️ Sheet unchanged since the last PDF; reusing it.")
+            return return_response({"result": "Success", "pdf_link": cached["pdf_link"], "cached": True})
+
+        with stage("sheet_read"):
+            reader.read_tables(ctx.sheet)
+        ctx.log(f"📄 Using Google Sheet: '{ctx.sheet.title}'")
+
+        OUTPUT_PDF = f"{ctx.sheet.title}.pdf"
+
+        with stage("settings"):
+            ctx.settings, size, top, bottom, logo_name = fetch_pdf_config_settings(ctx.sheet)
+        ctx.log("⚙️ PDF Config settings fetched.")
+
+        with stage("grouping"):
+            grouped_people = generate_grouped_people(ctx)
+        ctx.log(f"🧑‍🤝‍🧑 Grouped data for {len(grouped_people)} groups.")
+
+        fingerprint = compute_fingerprint(ctx.settings, grouped_people, logo_name, image_index)
+        cached = None if ctx.force else cached_render(ctx.sheet_id, fingerprint)
+        if cached:
+            save_render_record(ctx.sheet_id, modified_time, fingerprint, cached["file_id"], cached["pdf_link"], image_index)
+            return return_response({"result": "Success", "pdf_link": cached["pdf_link"], "cached": True})
+
+        logo_path = image_index.resolve([logo_name], stats=ctx.image_stats, log=ctx.log)[logo_name]
+        ctx.log(f"🖼️ Logo path: {logo_path}")
+
+        # Small PDFs stay in memory; anything above PDF_SPOOL_THRESHOLD_MB rolls over to a temp file.
+        pdf_buffer = ctx.keep(tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_THRESHOLD_MB * 1024 * 1024))
+        page = (size, top, bottom)
+        if str(ctx.settings.get("Engine", "chromium")).strip().lower() == "native":
+            _build_native(ctx, grouped_people, logo_path, page, pdf_buffer)
+        elif FRAGMENT_CACHE_MAX_MB and grouped_people:
+            _build_from_fragments(ctx, grouped_people, logo_name, logo_path, page, pdf_buffer)
+        else:
+            _build_in_batches(ctx, grouped_people, logo_path, page, pdf_buffer)
+        pdf_buffer.seek(0)
+
+        previous = load_render_record(ctx.sheet_id)
+        with stage("upload"):
+            file_id, file_link = upload_or_replace_file(
+                pdf_buffer, OUTPUT_PDF, PARENT_FOLDER,
+                file_id=previous["file_id"] if previous else None,
+                ctx=ctx
+            )
+        if file_id and ctx.images_complete:
+            save_render_record(ctx.sheet_id, modified_time, fingerprint, file_id, file_link, image_index)
+        elif file_id:
+            # Keep the file id for the next upload, but never serve this PDF from the cache.
+            ctx.log("⚠️ Some images could not be downloaded; this PDF will be regenerated next time.")
+            save_render_record(ctx.sheet_id, None, None, file_id, file_link, image_index)
 
         payload = {"result": "Success", "pdf_link": file_link}
         if not IS_PRODUCTION:
@@ -72,7 +220,7 @@ def generate(email, sheet_id):
 
     except Exception as e:
         error_payload = {"result": "Error", "error": str(e)}
-        log_message(f"🔥 Error during generation: {e}")
+        ctx.log(f"🔥 Error during generation: {e}")
         if not IS_PRODUCTION:
             return_response(error_payload)
         return error_payload
@@ -80,6 +228,6 @@ def generate(email, sheet_id):
 # === CLI Entrypoint ===
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print("Usage: python facesheet.py <email> <sheet_id>")
+        print("Usage: python facesheet.py <email> <sheet_id> [--force]")
         sys.exit(1)
-    generate(sys.argv[1], sys.argv[2])
\ No newline at end of file
+    generate(sys.argv[1], sys.argv[2], force="--force" in sys.argv[3:])
\ No newline at end of file
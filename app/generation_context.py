@@ -0,0 +1,44 @@
+from contextlib import ExitStack
+
+from logger import bind_logger
+from images_helper import current_image_index
+
+
+class GenerationContext:
+    """The state of one generate() run, so runs on other threads never share mutable state.
+
+    Holds the image index snapshot the run resolves against, a logger bound to the run's
+    job, the sheet and its settings, per-run image cache counts, and the buffers the run
+    creates (closed with the context, even when the run fails).
+    """
+
+    def __init__(self, email, sheet_id, force=False):
+        self.email = email
+        self.sheet_id = sheet_id
+        self.force = force
+        self.log = bind_logger()
+        self.image_index = current_image_index()
+        self.sheet = None
+        self.settings = {}
+        self.image_stats = {"hits": 0, "misses": 0}
+        # False once any image failed to download, so the PDF is not cached as final
+        self.images_complete = True
+        self._resources = ExitStack()
+
+    def refresh_image_index(self):
+        """Pin the run to the shared index as it is now (call after ensure_image_index)."""
+        self.image_index = current_image_index()
+        return self.image_index
+
+    def keep(self, resource):
+        """Close resource (anything usable in a with block) when the context closes; returns it."""
+        return self._resources.enter_context(resource)
+
+    def close(self):
+        self._resources.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
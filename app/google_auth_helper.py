@@ -1,8 +1,14 @@
 import os
-import gspread
-from googleapiclient.discovery import build
+import json
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from google.auth import impersonated_credentials, default as google_auth_default
-from config import IS_PRODUCTION
+from google.auth.transport.requests import Request
+from config import IS_PRODUCTION, ACCESS_ALLOW_TTL, ACCESS_DENY_TTL
 
 SERVICE_ACCOUNT_EMAIL = os.getenv("SERVICE_ACCOUNT_EMAIL")
 PARENT_FOLDER = os.getenv("PARENT_FOLDER")
@@ -10,51 +16,183 @@ PARENT_FOLDER = os.getenv("PARENT_FOLDER")
 # Scopes
 SCOPES_FULL = ["https://www.googleapis.com/auth/drive"]
 SCOPES_READONLY = ["https://www.googleapis.com/auth/drive.metadata.readonly"]
+SCOPES_SHEETS_READONLY = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
+
+# Refresh tokens this long before they expire, so no request starts with a dying token
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# === Credential & client registry ===
+# Credentials are shared process-wide, keyed by scope set. API clients sit on httplib2,
+# which is not thread-safe, so each thread gets its own client built from the same credentials.
+_registry_lock = threading.Lock()
+_default_credentials = None
+_credentials = {}
+_refresh_locks = {}
+_discovery_docs = {}
+_thread_clients = threading.local()
+
+def _reset_clients_after_fork():
+    # httplib2 connections must not be shared with a forked child (gunicorn --preload).
+    global _thread_clients
+    _thread_clients = threading.local()
+
+os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+def _source_credentials():
+    global _default_credentials
+    if _default_credentials is None:
+        _default_credentials, _ = google_auth_default()
+    return _default_credentials
+
+def _refresh_if_expiring(key, creds):
+    expiry = getattr(creds, "expiry", None)  # naive UTC, as google-auth stores it
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if creds.valid and (expiry is None or expiry - now > TOKEN_REFRESH_MARGIN):
+        return
+    with _refresh_locks[key]:
+        expiry = getattr(creds, "expiry", None)
+        if not creds.valid or (expiry is not None and expiry - now <= TOKEN_REFRESH_MARGIN):
+            creds.refresh(Request())
 
 def get_credentials(scopes):
-    """Load credentials with proper scopes."""
-    creds, _ = google_auth_default()
-
-    if not IS_PRODUCTION:
-        creds = impersonated_credentials.Credentials(
-            source_credentials=creds,
-            target_principal=SERVICE_ACCOUNT_EMAIL,
-            target_scopes=scopes,
-            lifetime=3600
-        )
-    else:
-        if not hasattr(creds, 'scopes') or not set(scopes).issubset(set(creds.scopes or [])):
-            creds = creds.with_scopes(scopes)
+    """Return shared credentials for a scope set, refreshed ahead of expiry."""
+    key = frozenset(scopes)
+    with _registry_lock:
+        creds = _credentials.get(key)
+        if creds is None:
+            creds = _source_credentials()
+            if not IS_PRODUCTION:
+                creds = impersonated_credentials.Credentials(
+                    source_credentials=creds,
+                    target_principal=SERVICE_ACCOUNT_EMAIL,
+                    target_scopes=list(scopes),
+                    lifetime=3600
+                )
+            else:
+                if not hasattr(creds, 'scopes') or not set(scopes).issubset(set(creds.scopes or [])):
+                    creds = creds.with_scopes(list(scopes))
+            _credentials[key] = creds
+            _refresh_locks[key] = threading.Lock()
 
+    _refresh_if_expiring(key, creds)
     return creds
 
-def get_sheet(sheet_id):
-    """Return a GSpread sheet client."""
-    creds = get_credentials(["https://www.googleapis.com/auth/spreadsheets.readonly"])
-    return gspread.authorize(creds).open_by_key(sheet_id)
+def _discovery_doc(api, version):
+    """Parse the discovery document bundled with googleapiclient once per process."""
+    with _registry_lock:
+        doc = _discovery_docs.get((api, version))
+        if doc is None:
+            doc = _discovery_docs[(api, version)] = json.loads(get_static_doc(api, version))
+        return doc
+
+def warm_discovery_docs():
+    """Parse the Drive and Sheets discovery documents ahead of the first request."""
+    _discovery_doc('drive', 'v3')
+    _discovery_doc('sheets', 'v4')
+
+def _get_client(api, version, scopes):
+    creds = get_credentials(scopes)
+    clients = getattr(_thread_clients, "clients", None)
+    if clients is None:
+        clients = _thread_clients.clients = {}
+    key = (api, version, frozenset(scopes))
+    if key not in clients:
+        clients[key] = build_from_document(_discovery_doc(api, version), credentials=creds)
+    return clients[key]
+
+def get_sheets_service():
+    """Return a Google Sheets API service."""
+    return _get_client('sheets', 'v4', SCOPES_SHEETS_READONLY)
 
 def get_drive_service(readonly=False):
     """Return a Google Drive service."""
     scopes = SCOPES_READONLY if readonly else SCOPES_FULL
-    creds = get_credentials(scopes)
-    return build('drive', 'v3', credentials=creds)
+    return _get_client('drive', 'v3', scopes)
 
-def has_drive_access(email):
-    """Check if an email has access to the parent folder."""
-    try:
-        service = get_drive_service(readonly=True)
-        permissions = service.permissions().list(
+# === Parent folder access index ===
+_access_lock = threading.Lock()
+_access_index = {"emails": None, "built_at": 0.0, "refreshing": False}
+
+def _fetch_permitted_emails():
+    """Return every email with a permission on the parent folder, following all pages."""
+    service = get_drive_service(readonly=True)
+    emails = set()
+    page_token = None
+    while True:
+        response = service.permissions().list(
             fileId=PARENT_FOLDER,
-            fields="permissions(emailAddress, role)",
+            fields="nextPageToken, permissions(emailAddress, role)",
+            pageSize=100,
+            pageToken=page_token,
             supportsAllDrives=True
         ).execute()
-
-        permitted_emails = [
+        emails.update(
             p['emailAddress'].lower()
-            for p in permissions.get('permissions', [])
+            for p in response.get('permissions', [])
             if 'emailAddress' in p
-        ]
-        return email.lower() in permitted_emails
+        )
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return emails
+
+def _refresh_access_index():
+    try:
+        emails = _fetch_permitted_emails()
+        with _access_lock:
+            _access_index.update(emails=emails, built_at=time.time())
     except Exception as e:
-        print(f"[Drive Access Check] Error: {e}")
-        return False
+        print(f"[Drive Access Check] Error refreshing permissions: {e}")
+    finally:
+        with _access_lock:
+            _access_index["refreshing"] = False
+
+def _refresh_access_index_in_background():
+    with _access_lock:
+        if _access_index["refreshing"]:
+            return
+        _access_index["refreshing"] = True
+    threading.Thread(target=_refresh_access_index, name="drive-access-refresh", daemon=True).start()
+
+def has_drive_access(email):
+    """Check if an email has access to the parent folder.
+
+    Answers come from a cached set of the folder's permissions. Allowed emails are trusted
+    for ACCESS_ALLOW_TTL and refreshed in the background after that; past twice that, the
+    set is refreshed in line and access is denied if Drive cannot be reached. Denials only
+    last ACCESS_DENY_TTL, so someone who was just shared in is let in quickly.
+    """
+    email = email.lower()
+    with _access_lock:
+        emails, built_at = _access_index["emails"], _access_index["built_at"]
+        if emails is None:
+            _access_index["refreshing"] = True
+
+    if emails is None:
+        _refresh_access_index()
+        with _access_lock:
+            emails, built_at = _access_index["emails"], _access_index["built_at"]
+        if emails is None:
+            return False
+
+    age = time.time() - built_at
+    if email in emails:
+        if age > 2 * ACCESS_ALLOW_TTL:
+            # Background refreshes keep failing; don't trust a share that may have been removed.
+            with _access_lock:
+                _access_index["refreshing"] = True
+            _refresh_access_index()
+            with _access_lock:
+                emails, built_at = _access_index["emails"], _access_index["built_at"]
+            return time.time() - built_at <= 2 * ACCESS_ALLOW_TTL and email in emails
+        if age > ACCESS_ALLOW_TTL:
+            _refresh_access_index_in_background()
+        return True
+
+    if age > ACCESS_DENY_TTL:
+        with _access_lock:
+            _access_index["refreshing"] = True
+        _refresh_access_index()
+        with _access_lock:
+            emails = _access_index["emails"]
+        return email in emails
+    return False
@@ -0,0 +1,9 @@
+# Loaded automatically by gunicorn from the working directory (/app in the container).
+
+def on_starting(server):
+    from metrics import reset_metrics
+    reset_metrics()
+
+def child_exit(server, worker):
+    from metrics import mark_worker_dead
+    mark_worker_dead(worker.pid)
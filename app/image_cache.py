@@ -0,0 +1,5 @@
+from disk_cache import DiskCache
+from config import IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB
+
+# Headshots, keyed by Drive file id + content version
+image_cache = DiskCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB * 1024 * 1024, name="image")
@@ -0,0 +1,84 @@
+import base64
+import mimetypes
+import threading
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, unquote
+
+import requests
+
+from config import IMAGE_PREFETCH_WORKERS, IMAGE_PREFETCH_TIMEOUT
+
+_local = threading.local()
+
+def _session():
+    # requests.Session is not thread-safe, so each pool thread keeps its own.
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+def fetch_image(src):
+    """Return (bytes, mime_type) for an http(s) URL, file:// URI or local path."""
+    parsed = urlparse(src)
+    if parsed.scheme in ("http", "https"):
+        response = _session().get(src, timeout=IMAGE_PREFETCH_TIMEOUT)
+        response.raise_for_status()
+        mime_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        if not mime_type.startswith("image/"):
+            raise ValueError(f"not an image ({mime_type or 'no content type'})")
+        return response.content, mime_type
+
+    path = unquote(parsed.path) if parsed.scheme == "file" else src
+    with open(path, "rb") as f:
+        data = f.read()
+    return data, mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+def to_data_uri(data, mime_type):
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+def _fetch_data_uri(ctx, src):
+    try:
+        data, mime_type = fetch_image(src)
+    except Exception as e:
+        ctx.log(f"⚠️ Could not prefetch image {src}: {e}")
+        return src, None
+
+    try:
+        ctx.image_index.remember_bytes(src, data)
+    except OSError as e:
+        ctx.log(f"⚠️ Could not cache image {src}: {e}")
+    return src, to_data_uri(data, mime_type)
+
+def prefetch_images(ctx, grouped_people, logo_path):
+    """Download every referenced image concurrently and inline them as data URIs.
+
+    People in grouped_people are updated in place; the inlined logo src is returned.
+    Images that fail to download keep their original src, so the browser can still try them,
+    and mark ctx.images_complete False.
+    """
+    srcs = {p["Image File"] for people in grouped_people.values() for p in people if p["Image File"]}
+    if logo_path:
+        srcs.add(logo_path)
+    if not srcs:
+        return logo_path
+
+    started = time.monotonic()
+    caller_context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=min(IMAGE_PREFETCH_WORKERS, len(srcs))) as pool:
+        results = pool.map(lambda src: caller_context.copy().run(_fetch_data_uri, ctx, src), srcs)
+        inlined = {src: uri for src, uri in results if uri}
+    if len(inlined) < len(srcs):
+        ctx.images_complete = False
+
+    for people in grouped_people.values():
+        for p in people:
+            p["Image File"] = inlined.get(p["Image File"], p["Image File"])
+
+    elapsed = round(time.monotonic() - started, 2)
+    stats = ctx.image_stats
+    ctx.log(
+        f"📥 Prefetched {len(inlined)}/{len(srcs)} images in {elapsed}s "
+        f"(image cache: {stats['hits']} hits, {stats['misses']} misses)."
+    )
+    return inlined.get(logo_path, logo_path)
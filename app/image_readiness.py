@@ -0,0 +1,102 @@
+import time
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+from logger import log_message
+from metrics import IMAGE_MISSES
+from config import IMAGE_WAIT_DEADLINE_MS, IMAGE_WAIT_PER_IMAGE_MS, IMAGE_URL_TEMPLATE
+
+DRIVE_IMAGE_SELECTOR = f'img[src^="{IMAGE_URL_TEMPLATE.split("{file_id}")[0]}"]'
+
+# Light grey box shown in place of any headshot that failed or timed out.
+PLACEHOLDER_IMAGE = (
+    "data:image/svg+xml;utf8,"
+    "<svg xmlns='http://www.w3.org/2000/svg' width='140' height='150'>"
+    "<rect width='100%' height='100%' fill='%23e5e5e5'/></svg>"
+)
+
+_TRACK_IMAGES_JS = """
+({selector, perImageMs, deadlineMs}) => new Promise(resolve => {
+    const images = Array.from(document.querySelectorAll(selector));
+    const result = {loaded: [], failed: [], timedOut: []};
+    let pending = images.length;
+    if (pending === 0) {
+        resolve(result);
+        return;
+    }
+    const settle = (img, bucket) => {
+        if (img.__facesheetSettled) return;
+        img.__facesheetSettled = true;
+        result[bucket].push(img.getAttribute('src'));
+        pending -= 1;
+        if (pending === 0) resolve(result);
+    };
+    images.forEach(img => {
+        if (img.complete) {
+            settle(img, img.naturalWidth > 0 ? 'loaded' : 'failed');
+            return;
+        }
+        img.addEventListener('load', () => settle(img, 'loaded'), {once: true});
+        img.addEventListener('error', () => settle(img, 'failed'), {once: true});
+        setTimeout(() => settle(img, 'timedOut'), perImageMs);
+    });
+    setTimeout(() => images.forEach(img => settle(img, 'timedOut')), deadlineMs);
+});
+"""
+
+_APPLY_PLACEHOLDER_JS = """
+({selector, srcs, placeholder}) => {
+    const wanted = new Set(srcs);
+    document.querySelectorAll(selector).forEach(img => {
+        if (wanted.has(img.getAttribute('src'))) img.src = placeholder;
+    });
+}
+"""
+
+def wait_for_images_ready(page, deadline_ms=IMAGE_WAIT_DEADLINE_MS, per_image_ms=IMAGE_WAIT_PER_IMAGE_MS, log=log_message):
+    """Wait on each Drive image's load/error event, then for network idle, all within one deadline.
+
+    Returns a report with the srcs that loaded, failed and timed out. Failed and timed out
+    images are swapped for a placeholder so the PDF never waits on them.
+    """
+    started = time.monotonic()
+    report = page.evaluate(_TRACK_IMAGES_JS, {
+        "selector": DRIVE_IMAGE_SELECTOR,
+        "perImageMs": per_image_ms,
+        "deadlineMs": deadline_ms,
+    })
+
+    remaining_ms = deadline_ms - int((time.monotonic() - started) * 1000)
+    if remaining_ms > 0:
+        try:
+            page.wait_for_load_state("networkidle", timeout=remaining_ms)
+        except PlaywrightTimeoutError:
+            log("⚠️ Network did not go idle before the image deadline.")
+
+    missing = report["failed"] + report["timedOut"]
+    if missing:
+        IMAGE_MISSES.labels(reason="placeholder").inc(len(missing))
+        page.evaluate(_APPLY_PLACEHOLDER_JS, {
+            "selector": DRIVE_IMAGE_SELECTOR,
+            "srcs": missing,
+            "placeholder": PLACEHOLDER_IMAGE,
+        })
+
+    elapsed = round(time.monotonic() - started, 2)
+    if missing:
+        log(
+            f"⚠️ {len(report['loaded'])} Google Drive images loaded in {elapsed}s; "
+            f"{len(report['failed'])} failed and {len(report['timedOut'])} timed out (placeholders used)."
+        )
+        for src in report["timedOut"]:
+            log(f"⏱️ Timed out: {src}")
+        for src in report["failed"]:
+            log(f"❌ Failed: {src}")
+    else:
+        log(f"✅ All {len(report['loaded'])} Google Drive images loaded in {elapsed}s")
+
+    return {
+        "loaded": report["loaded"],
+        "failed": report["failed"],
+        "timed_out": report["timedOut"],
+        "seconds": elapsed,
+    }
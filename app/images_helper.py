@@ -1,26 +1,169 @@
 import os
+import re
+import time
+import difflib
+import hashlib
+import pathlib
+import threading
 import unicodedata
-from dotenv import load_dotenv
+from datetime import datetime, timezone
 
 from logger import log_message
+from metrics import IMAGE_MISSES
 from google_auth_helper import get_drive_service
+from image_cache import image_cache
+from drive_changes import get_start_page_token, list_changes
+from config import IMAGE_INDEX_TTL, IMAGE_INDEX_POLL_SECONDS, IMAGE_INDEX_RETRY_SECONDS, IMAGE_URL_TEMPLATE
 
-# === Environment Setup ===
-load_dotenv()
+IMAGE_FIELDS = "id, name, parents, trashed, md5Checksum, modifiedTime"
+# Extensions that count as images, highest precedence first when a name exists more than once
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
 
-# Drive service
-drive_service = get_drive_service()
+_index_lock = threading.Lock()
+_index_state = {
+    "parent_folder_id": None,
+    "images_folder_id": None,
+    "changes_token": None,
+    "built_at": None,
+    "synced_at": None,
+    "failed_at": None,
+}
 
-# Global index
-_image_index = {}
+def drive_image_url(file_id):
+    return IMAGE_URL_TEMPLATE.format(file_id=file_id)
+
+def _image_version(item):
+    return item.get('md5Checksum') or item.get('modifiedTime', '')
+
+def _image_ext(item):
+    return os.path.splitext(item['name'])[1]
+
+def _norm_key(name):
+    return unicodedata.normalize('NFKD', name).lower()
+
+def _stem_key(name):
+    """Normalized name with any image extension removed, so 'logo' and 'logo.png' both match."""
+    norm_name = _norm_key(name)
+    stem, ext = os.path.splitext(norm_name)
+    return stem if ext in IMAGE_EXTENSIONS else norm_name
+
+def _loose_key(stem):
+    return re.sub(r'[^a-z0-9]', '', ''.join(c for c in stem if not unicodedata.combining(c)))
+
+
+class ImageIndex:
+    """An immutable snapshot of the Drive 'images' folder.
+
+    Updates build a new snapshot and swap it in, so a generation can hold on to the one
+    it started with while the shared index keeps moving.
+    """
+
+    def __init__(self, by_id):
+        self.by_id = by_id
+
+        # Normalized file stem (name without extension) -> Drive file metadata
+        by_stem = {}
+        for item in by_id.values():
+            stem, ext = os.path.splitext(_norm_key(item['name']))
+            if ext not in IMAGE_EXTENSIONS:
+                continue
+            current = by_stem.get(stem)
+            if current is None or IMAGE_EXTENSIONS.index(ext) < IMAGE_EXTENSIONS.index(_image_ext(current).lower()):
+                by_stem[stem] = item
+        self.by_stem = by_stem
+
+        # Near-miss index: stem reduced to plain letters and digits -> stems, for "did you mean" hints
+        self.loose = {}
+        for stem in by_stem:
+            self.loose.setdefault(_loose_key(stem), []).append(stem)
+        self.loose_keys = list(self.loose)
+        self.suggestions = {}  # loose key -> suggested stem; the snapshot never changes, so neither do these
+
+        # Reverse lookup: Drive image URL -> Drive file metadata
+        self.by_url = {drive_image_url(item['id']): item for item in by_stem.values()}
+
+        digest = hashlib.sha256()
+        for file_id in sorted(by_id):
+            digest.update(f"{file_id}:{_image_version(by_id[file_id])}\n".encode("utf-8"))
+        self.fingerprint = digest.hexdigest()
+
+    def find(self, image_name):
+        """Return the Drive metadata for an image name (extension optional), or None."""
+        return self.by_stem.get(_stem_key(image_name))
+
+    def version_key(self, image_name):
+        """Return 'file_id:version' for an image name, or None if it is not indexed."""
+        item = self.find(image_name)
+        return f"{item['id']}:{_image_version(item)}" if item else None
+
+    def suggest(self, image_name):
+        """Return the closest indexed stem for a missing image name, or None."""
+        loose = _loose_key(_stem_key(image_name))
+        if loose in self.loose:
+            return self.loose[loose][0]
+        if loose not in self.suggestions:
+            close = difflib.get_close_matches(loose, self.loose_keys, n=1, cutoff=0.85)
+            self.suggestions[loose] = self.loose[close[0]][0] if close else None
+        return self.suggestions[loose]
+
+    def resolve(self, image_names, stats=None, log=log_message):
+        """Resolve many image names in one pass.
+
+        Returns {name: src or None}; src is a file:// URI for a valid cached copy, otherwise the
+        Drive image URL. Cache hits and misses are added to stats, and names that are not
+        found are reported in a single summary line.
+        """
+        resolved = {}
+        missing = []
+        for name in image_names:
+            if name in resolved:
+                continue
+            item = self.find(name)
+            if not item:
+                resolved[name] = None
+                missing.append(name)
+                continue
+            cached = image_cache.get(item['id'], _image_version(item), _image_ext(item))
+            if stats is not None:
+                stats["hits" if cached else "misses"] += 1
+            resolved[name] = pathlib.Path(cached).as_uri() if cached else drive_image_url(item['id'])
+
+        if missing:
+            IMAGE_MISSES.labels(reason="not_found").inc(len(missing))
+            details = []
+            for name in missing:
+                suggestion = self.suggest(name)
+                details.append(f"'{_stem_key(name)}' (did you mean '{suggestion}'?)" if suggestion else f"'{_stem_key(name)}'")
+            log(f"❌ {len(missing)} image(s) not found in Drive image index: {', '.join(details)}")
+        return resolved
+
+    def remember_bytes(self, src, data):
+        """Store downloaded bytes for a Drive image URL in the local image cache."""
+        item = self.by_url.get(src)
+        if item:
+            image_cache.put(item['id'], _image_version(item), _image_ext(item), data)
+
+
+# The shared, current snapshot; replaced wholesale on every update.
+_current_index = ImageIndex({})
+
+def _swap_index(by_id):
+    global _current_index
+    _current_index = ImageIndex(by_id)
+
+def current_image_index():
+    """Return the current image index snapshot; it never changes once handed out."""
+    return _current_index
 
 def initialize_image_index(PARENT_FOLDER_ID):
     """Fetch all image names from 'images' subfolder in Google Drive and normalize to lowercase."""
-    global _image_index
-    _image_index = {}  # Reset index each run
     log_message("🔄 Initializing image index from Google Drive 'images' subfolder...")
 
     try:
+        # Take the changes token first so nothing changed during the listing is missed.
+        drive_service = get_drive_service()
+        changes_token = get_start_page_token(drive_service)
+
         images_folder_response = drive_service.files().list(
             q=f"'{PARENT_FOLDER_ID}' in parents and name='images' and mimeType='application/vnd.google-apps.folder' and trashed=false",
             fields="files(id)",
@@ -31,45 +174,118 @@ def initialize_image_index(PARENT_FOLDER_ID):
         if not images_folder:
             error_message = f"⚠️ Error: 'images' subfolder not found within parent folder with ID: {PARENT_FOLDER_ID}"
             log_message(error_message)
-            _image_index = {}
+            _swap_index({})
+            _index_state.update(parent_folder_id=None, images_folder_id=None, changes_token=None, built_at=None)
             return
 
         images_folder_id = images_folder[0]['id']
 
+        by_id = {}
         page_token = None
         while True:
             response = drive_service.files().list(
                 q=f"'{images_folder_id}' in parents and trashed=false",
-                fields="nextPageToken, files(id, name)",
+                fields=f"nextPageToken, files({IMAGE_FIELDS})",
                 pageSize=1000,
                 pageToken=page_token
             ).execute()
 
             for item in response.get('files', []):
-                name = item['name']
-                file_id = item['id']
-                norm_key = unicodedata.normalize('NFKD', name).lower()
-                _image_index[norm_key] = f"https://lh3.googleusercontent.com/d/{file_id}=s750?authuser=0"
+                by_id[item['id']] = item
 
             page_token = response.get('nextPageToken')
             if not page_token:
                 break
 
-        log_message(f"✅ Indexed {len(_image_index)} images from 'images' subfolder.")
+        _swap_index(by_id)
+        now = time.time()
+        _index_state.update(
+            parent_folder_id=PARENT_FOLDER_ID,
+            images_folder_id=images_folder_id,
+            changes_token=changes_token,
+            built_at=now,
+            synced_at=now,
+            failed_at=None
+        )
+        log_message(f"✅ Indexed {len(_current_index.by_stem)} images from 'images' subfolder.")
     except Exception as e:
         error_message = f"⚠️ Error indexing images from Drive: {e}"
         log_message(error_message)
-        _image_index = {}
+        if _index_state["built_at"] is not None and _index_state["parent_folder_id"] == PARENT_FOLDER_ID:
+            # A transient Drive error must not cost every run its headshots.
+            _index_state.update(failed_at=time.time())
+            log_message(f"↩️ Keeping the previous image index; retrying in {IMAGE_INDEX_RETRY_SECONDS}s.")
+            return
+        _swap_index({})
+        _index_state.update(parent_folder_id=None, images_folder_id=None, changes_token=None, built_at=None)
+
+def _apply_image_changes():
+    """Apply the Drive changes feed since the saved token to the index."""
+    changes, new_token = list_changes(get_drive_service(), _index_state["changes_token"], IMAGE_FIELDS)
+    images_folder_id = _index_state["images_folder_id"]
 
+    by_id = dict(_current_index.by_id)
+    updated = removed = 0
+    for change in changes:
+        item = change.get('file')
+        in_folder = (
+            not change.get('removed')
+            and item is not None
+            and not item.get('trashed')
+            and images_folder_id in item.get('parents', [])
+        )
+        if in_folder:
+            by_id[change['fileId']] = item
+            updated += 1
+        elif by_id.pop(change['fileId'], None) is not None:
+            removed += 1
 
-def check_image_exists(image_name):
-    """Look up the image in the normalized index with common extensions."""
-    norm_name = unicodedata.normalize('NFKD', image_name).lower()
+    if updated or removed:
+        _swap_index(by_id)
+        log_message(f"🔁 Image index updated from Drive changes: {updated} added/changed, {removed} removed.")
+    _index_state.update(changes_token=new_token, synced_at=time.time())
+
+def ensure_image_index(PARENT_FOLDER_ID):
+    """Keep the shared image index current.
+
+    The index is built once, then kept up to date from the Drive changes feed, with a
+    full rebuild whenever it is older than IMAGE_INDEX_TTL. When Drive fails, the index
+    already built is kept and Drive is retried after IMAGE_INDEX_RETRY_SECONDS.
+    """
+    with _index_lock:
+        built_at = _index_state["built_at"]
+        now = time.time()
+        if built_at is None or _index_state["parent_folder_id"] != PARENT_FOLDER_ID:
+            initialize_image_index(PARENT_FOLDER_ID)
+            return
+
+        failed_at = _index_state["failed_at"]
+        if failed_at is not None and now - failed_at < IMAGE_INDEX_RETRY_SECONDS:
+            return  # Drive failed recently; serve the index we have
+
+        if now - built_at > IMAGE_INDEX_TTL:
+            initialize_image_index(PARENT_FOLDER_ID)
+            return
+
+        if now - _index_state["synced_at"] < IMAGE_INDEX_POLL_SECONDS:
+            return
 
-    for ext in ['.png', '.jpg', '.jpeg']:
-        key = f"{norm_name}{ext}"
-        if key in _image_index:
-            return _image_index[key]
+        try:
+            _apply_image_changes()
+        except Exception as e:
+            log_message(f"⚠️ Could not read Drive changes ({e}); rebuilding image index.")
+            initialize_image_index(PARENT_FOLDER_ID)
 
-    log_message(f"❌ '{norm_name}' not found in Drive image index.")
-    return None
\ No newline at end of file
+def image_index_status():
+    """Describe the shared image index: size, age and how recently it was synced."""
+    built_at = _index_state["built_at"]
+    synced_at = _index_state["synced_at"]
+    now = time.time()
+    return {
+        "images": len(_current_index.by_stem),
+        "built_at": datetime.fromtimestamp(built_at, timezone.utc).isoformat() if built_at else None,
+        "age_seconds": round(now - built_at, 1) if built_at else None,
+        "last_sync_seconds_ago": round(now - synced_at, 1) if synced_at else None,
+        "fresh": built_at is not None and now - built_at <= IMAGE_INDEX_TTL,
+        "ttl_seconds": IMAGE_INDEX_TTL,
+    }
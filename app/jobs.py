@@ -0,0 +1,316 @@
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from logger import log_message, log_sink, log_context, append_line
+from metrics import STAGE_SECONDS, GENERATION_SECONDS, track_stage
+from config import JOB_DIR, JOB_WORKERS, JOB_STALE_SECONDS, JOB_RETENTION_SECONDS
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_EVENTS = ("done", "error")
+
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+def stage(name):
+    """Time a pipeline stage into the stage histogram and the job running on this thread, if any."""
+    job = _current_job.get()
+    return job.stage(name) if job else track_stage(name)
+
+
+class Job:
+    """A single /generate request; its state is mirrored to JOB_DIR so any worker can report it."""
+
+    def __init__(self, email, sheet_id, force=False):
+        self.id = uuid.uuid4().hex
+        self.email = email
+        self.sheet_id = sheet_id
+        self.force = force
+        self.status = "queued"
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.started_at = None
+        self.finished_at = None
+        self.timings = {}
+        self.pdf_link = None
+        self.cached = False
+        self.duration = None
+        self.error = None
+        self._event_id = 0
+        self._event_lock = threading.Lock()
+        self._timings_lock = threading.Lock()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "email": self.email,
+            "sheet_id": self.sheet_id,
+            "force": self.force,
+            "status": self.status,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timings": self.timings_snapshot(),
+            "pdf_link": self.pdf_link,
+            "cached": self.cached,
+            "duration": self.duration,
+            "error": self.error,
+        }
+
+    def timings_snapshot(self):
+        with self._timings_lock:
+            return dict(self.timings)
+
+    def save(self):
+        self.updated_at = time.time()
+        fd, tmp_path = tempfile.mkstemp(dir=JOB_DIR, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, _job_path(self.id))
+
+    def emit(self, event, data):
+        """Append a progress event to this job's stream; late subscribers replay it from the start."""
+        with self._event_lock:
+            self._event_id += 1
+            line = json.dumps({"id": self._event_id, "event": event, "data": data})
+            append_line(_events_path(self.id), line)
+
+    @contextmanager
+    def stage(self, name):
+        self.emit("stage", {"stage": name, "state": "started"})
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - started
+            STAGE_SECONDS.labels(stage=name).observe(seconds)
+            # A stage can run more than once (retries, parallel PDF batches); its time adds up.
+            with self._timings_lock:
+                self.timings[name] = round(self.timings.get(name, 0) + seconds, 3)
+            self.save()
+            self.emit("stage", {"stage": name, "state": "finished", "seconds": round(seconds, 3)})
+
+
+def _job_path(job_id):
+    return os.path.join(JOB_DIR, f"{job_id}.json")
+
+def _events_path(job_id):
+    return os.path.join(JOB_DIR, f"{job_id}.events")
+
+def _inflight_path(sheet_id):
+    return os.path.join(JOB_DIR, f"inflight-{sheet_id}")
+
+def load_job(job_id):
+    """Return a job's last saved state, or None if unknown."""
+    if not all(c in "0123456789abcdef" for c in job_id):
+        return None
+    try:
+        with open(_job_path(job_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def read_job_events(job_id, after_id=0, offset=0):
+    """Return (events with an id greater than after_id, new offset), reading from byte offset on.
+
+    Pass the returned offset back in to read only what was appended since the last call.
+    """
+    try:
+        with open(_events_path(job_id), "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+
+    complete = data.rfind(b"\n") + 1  # A trailing partial line is still being written
+    events = []
+    for line in data[:complete].splitlines():
+        event = json.loads(line)
+        if event["id"] > after_id:
+            events.append(event)
+    return events, offset + complete
+
+
+def prune_jobs(now=None):
+    """Delete the files of jobs that finished more than JOB_RETENTION_SECONDS ago.
+
+    Jobs that never finished (their worker died) are pruned once they have also been
+    stale for as long. Returns the number of jobs removed.
+    """
+    now = now or time.time()
+    removed = 0
+    for entry in os.scandir(JOB_DIR):
+        if not entry.name.endswith(".json") or entry.name.startswith("."):
+            continue
+        job = load_job(entry.name[:-len(".json")])
+        if job is None:
+            continue
+        if job["status"] in ACTIVE_STATUSES:
+            expired = now - job["updated_at"] > JOB_STALE_SECONDS + JOB_RETENTION_SECONDS
+        else:
+            expired = now - job["updated_at"] > JOB_RETENTION_SECONDS
+        if expired:
+            for path in (_job_path(job["job_id"]), _events_path(job["job_id"])):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            removed += 1
+    return removed
+
+
+class JobQueue:
+    """Runs generations on a bounded pool of background threads, coalescing identical requests per sheet."""
+
+    def __init__(self, run_fn, workers=JOB_WORKERS):
+        self.run_fn = run_fn
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pruned_at = 0
+        os.makedirs(JOB_DIR, exist_ok=True)
+
+    def _get_executor(self):
+        # Created on first use so threads start in the serving worker, not a preloading master.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render-job")
+            return self._executor
+
+    def _claim_sheet(self, job):
+        """Mark this job as the in-flight one for its sheet, or return the job already running it.
+
+        Call after job.save(), so the marker never points at a job file that does not exist yet.
+        """
+        path = _inflight_path(job.sheet_id)
+        # The marker is linked into place already written, so no reader ever sees it empty.
+        fd, tmp_path = tempfile.mkstemp(dir=JOB_DIR, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            f.write(job.id)
+        try:
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, path)
+                    return None
+                except FileExistsError:
+                    try:
+                        with open(path) as f:
+                            existing = load_job(f.read().strip())
+                    except FileNotFoundError:
+                        continue
+                    if (
+                        existing
+                        and existing["status"] in ACTIVE_STATUSES
+                        and time.time() - existing["updated_at"] < JOB_STALE_SECONDS
+                    ):
+                        if job.force and not existing["force"]:
+                            # A forced run must not be answered by a run that may reuse the cached PDF;
+                            # it runs alongside, and later requests for the sheet join it instead.
+                            os.replace(tmp_path, path)
+                            return None
+                        return existing
+                    try:
+                        os.remove(path)  # Finished or abandoned by a dead worker
+                    except FileNotFoundError:
+                        pass
+            return None
+        finally:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass  # Moved into place as the marker
+
+    def _prune(self):
+        # At most once a minute per process; submissions are the only thing that adds jobs.
+        with self._lock:
+            if time.time() - self._pruned_at < 60:
+                return
+            self._pruned_at = time.time()
+        try:
+            removed = prune_jobs()
+        except OSError as e:
+            log_message(f"⚠️ Could not prune old jobs: {e}")
+            return
+        if removed:
+            log_message(f"🧹 Pruned {removed} old job(s).")
+
+    def _release_sheet(self, job):
+        path = _inflight_path(job.sheet_id)
+        try:
+            with open(path) as f:
+                if f.read().strip() == job.id:
+                    os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def submit(self, email, sheet_id, force=False, ticket=None):
+        """Queue a generation and return (job state, coalesced).
+
+        ticket (anything with release()) is held for as long as the job is queued or running.
+        """
+        self._prune()
+        job = Job(email, sheet_id, force)
+        job.save()
+        existing = self._claim_sheet(job)
+        if existing:
+            os.remove(_job_path(job.id))
+            log_message(f"🔗 Sheet {sheet_id} is already being generated; joining job {existing['job_id']}.")
+            if ticket:
+                ticket.release()
+            return existing, True
+
+        job.emit("status", {"status": job.status})
+        self._get_executor().submit(self._run, job, ticket)
+        return job.to_dict(), False
+
+    def _run(self, job, ticket=None):
+        token = _current_job.set(job)
+        job.status = "running"
+        job.started_at = time.time()
+        job.save()
+        job.emit("status", {"status": job.status})
+        try:
+            with log_context(job_id=job.id, user=job.email, sheet=job.sheet_id), \
+                    log_sink(lambda msg: job.emit("log", {"message": msg})):
+                try:
+                    log_message("Generation started...")
+                    result = self.run_fn(job.email, job.sheet_id, force=job.force)
+                    job.duration = round(time.time() - job.started_at, 2)
+                    if result.get("result") == "Success":
+                        job.status = "done"
+                        job.pdf_link = result.get("pdf_link")
+                        job.cached = result.get("cached", False)
+                        log_message(f"🎉 All done in {job.duration} seconds! PDF Link: {job.pdf_link}")
+                    else:
+                        job.status = "error"
+                        job.error = result.get("error")
+                        log_message(f"❌ Error during generation: {job.error}")
+                except Exception as e:
+                    job.status = "error"
+                    job.error = str(e)
+                    job.duration = round(time.time() - job.started_at, 2)
+                    log_message(f"❌ Error during generation: {e}")
+        finally:
+            job.finished_at = time.time()
+            job.save()
+            outcome = "cached" if job.cached else job.status
+            GENERATION_SECONDS.labels(outcome=outcome).observe(job.finished_at - job.started_at)
+            if job.status == "done":
+                job.emit("done", {
+                    "pdf_link": job.pdf_link,
+                    "cached": job.cached,
+                    "duration": job.duration,
+                    "timings": job.timings
+                })
+            else:
+                job.emit("error", {"error": job.error, "duration": job.duration, "timings": job.timings})
+            self._release_sheet(job)
+            if ticket:
+                ticket.release()
+            _current_job.reset(token)
@@ -1,8 +1,150 @@
 import os
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
 
-LOG_FILE = os.path.join(os.getcwd(), "log.txt")
+from config import LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL, LOG_MAX_MB
+
+LOG_FILE = os.path.join(os.getcwd(), "log.jsonl")
+
+# Extra destination for messages logged inside a job (its progress event stream)
+_log_sink = contextvars.ContextVar("log_sink", default=None)
+# Fields stamped on every record logged in this context (job id, user, sheet)
+_log_context = contextvars.ContextVar("log_context", default={})
+
+@contextmanager
+def log_sink(sink):
+    """Also send every message logged in this context to sink(msg)."""
+    token = _log_sink.set(sink)
+    try:
+        yield
+    finally:
+        _log_sink.reset(token)
+
+@contextmanager
+def log_context(**fields):
+    """Attach fields such as job_id, user and sheet to every record logged in this context."""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def _rotate_if_large(path):
+    """Move path to path.1 (replacing the previous one) once it passes LOG_MAX_MB."""
+    try:
+        if LOG_MAX_MB and os.path.getsize(path) > LOG_MAX_MB * 1024 * 1024:
+            os.replace(path, path + ".1")
+    except OSError:
+        pass  # Not created yet, or another worker rotated it first
+
+
+class _LogWriter:
+    """Background thread that batches appends so callers never wait on file I/O."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _ensure_thread(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self.thread.start()
+
+    def put(self, item):
+        self._ensure_thread()
+        self.queue.put(item)
+
+    def flush(self, timeout=5):
+        """Block until everything queued so far has been written."""
+        if self.thread is None:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+            while len(batch) < LOG_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                if isinstance(batch[-1], threading.Event):
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        lines_by_path = {}
+        flushed = []
+        for item in batch:
+            if isinstance(item, threading.Event):
+                flushed.append(item)
+                continue
+            path, line, echo = item
+            if echo is not None:
+                print(echo)
+            lines_by_path.setdefault(path, []).append(line)
+
+        for path, lines in lines_by_path.items():
+            if path == LOG_FILE:
+                _rotate_if_large(path)
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("".join(lines))
+            except OSError as e:
+                print(f"⚠️ Could not write {path}: {e}", file=sys.stderr)
+        sys.stdout.flush()
+
+        for event in flushed:
+            event.set()
+
+
+_writer = _LogWriter()
+
+def _reset_after_fork():
+    global _writer
+    _writer = _LogWriter()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(lambda: _writer.flush())
+
+def append_line(path, line):
+    """Queue a line to be appended to path by the background writer."""
+    _writer.put((path, line + "\n", None))
+
+def flush_logs(timeout=5):
+    _writer.flush(timeout)
+
+def _log(msg, fields, sink):
+    record = {
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "message": msg,
+        **fields,
+    }
+    _writer.put((LOG_FILE, json.dumps(record, ensure_ascii=False) + "\n", msg))
+    if sink:
+        sink(msg)
+
+def bind_logger():
+    """Return a log function that keeps this context's fields and sink on any thread it is called from."""
+    fields, sink = _log_context.get(), _log_sink.get()
+    return lambda msg: _log(msg, fields, sink)
 
 def log_message(msg):
-    print(msg)
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(msg + "\n")
+    _log(msg, _log_context.get(), _log_sink.get())
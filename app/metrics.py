@@ -0,0 +1,73 @@
+import os
+import time
+import shutil
+from contextlib import contextmanager
+
+from config import METRICS_DIR
+
+# Every gunicorn worker writes its samples under METRICS_DIR; /metrics adds them up.
+# prometheus_client reads this variable at import, so it must be set first.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", METRICS_DIR)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "facesheet_stage_seconds", "Time spent in each generation stage", ["stage"], buckets=STAGE_BUCKETS
+)
+GENERATION_SECONDS = Histogram(
+    "facesheet_generation_seconds", "End-to-end generation time", ["outcome"], buckets=STAGE_BUCKETS
+)
+IMAGE_MISSES = Counter(
+    "facesheet_image_misses_total", "Headshots that could not be used", ["reason"]
+)
+PDF_RENDER_RETRIES = Counter(
+    "facesheet_pdf_render_retries_total", "PDF renders retried after a browser error"
+)
+CACHE_HITS = Counter(
+    "facesheet_cache_hits_total", "Work skipped thanks to a cache", ["cache"]
+)
+CACHE_MISSES = Counter(
+    "facesheet_cache_misses_total", "Cache lookups that found nothing usable", ["cache"]
+)
+ACTIVE_RENDERS = Gauge(
+    "facesheet_active_renders", "PDF renders in progress", multiprocess_mode="livesum"
+)
+RENDER_QUEUE_DEPTH = Gauge(
+    "facesheet_render_queue_depth", "Renders waiting for a free render slot", multiprocess_mode="livesum"
+)
+RENDER_WAIT_SECONDS = Histogram(
+    "facesheet_render_wait_seconds", "Time spent waiting for a render slot", buckets=STAGE_BUCKETS
+)
+RENDER_REJECTIONS = Counter(
+    "facesheet_render_rejections_total", "Generate requests turned away because the render queue was full"
+)
+
+@contextmanager
+def track_stage(name):
+    """Observe a stage's duration when no job is recording it (CLI runs, warm-up)."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=name).observe(time.monotonic() - started)
+
+def reset_metrics():
+    """Clear samples left by earlier server runs; call once before workers start."""
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+def mark_worker_dead(pid):
+    """Drop a dead worker's live gauges (gunicorn child_exit hook)."""
+    multiprocess.mark_process_dead(pid)
+
+def render_metrics():
+    """Return (body, content type) for the /metrics endpoint, summed over all workers."""
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,281 @@
+import io
+import os
+import re
+import base64
+import time
+import threading
+
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.utils import ImageReader
+from reportlab.lib.colors import black, HexColor
+
+from logger import log_message
+from image_prefetch import fetch_image
+from config import NATIVE_PDF_FONT, NATIVE_PDF_FONT_BOLD, NATIVE_PDF_FALLBACK_FONT
+
+# Draws the card grid of templates/facesheet.html straight to PDF, without a browser.
+# Sizes below are the template's CSS pixels; CSS has 96 px per inch and PDF 72 pt.
+PX = 0.75
+
+UNITS_PT = {"px": PX, "pt": 1.0, "in": 72.0, "cm": 72 / 2.54, "mm": 72 / 25.4}
+
+# Playwright/Chromium paper formats, in points (portrait)
+PAGE_SIZES = {
+    "letter": (612, 792),
+    "legal": (612, 1008),
+    "tabloid": (792, 1224),
+    "ledger": (1224, 792),
+    "a0": (2384, 3370),
+    "a1": (1684, 2384),
+    "a2": (1191, 1684),
+    "a3": (842, 1191),
+    "a4": (595, 842),
+    "a5": (420, 595),
+    "a6": (298, 420),
+}
+
+# reportlab's built-in Helvetica only covers WinAnsi, so names like "Łukasz" need a TrueType font.
+# These are replaced by the registered TrueType fonts on the first render (see _load_fonts).
+FONT = "Helvetica"
+FONT_BOLD = "Helvetica-Bold"
+FALLBACK_FONT = None
+_fonts_loaded = False
+_fonts_lock = threading.Lock()
+PLACEHOLDER_COLOR = HexColor("#e5e5e5")
+
+BODY_MARGIN = 40 * PX
+OUTLINE = 1.5 * PX
+CARD = {"width": 140 * PX, "height": 250 * PX, "image_height": 150 * PX, "grid_width": 1080 * PX}
+HEADLINE_CARD = {"width": 160 * PX, "height": 280 * PX, "image_height": 190 * PX, "grid_width": 950 * PX}
+IMAGE_PADDING = 7 * PX
+DATA_OFFSET = 7 * PX + 5 * PX + 3 * PX  # img margin-bottom + .data margin-top + padding
+DATA_PADDING = 3 * PX
+NAME_SIZE = 10
+ROLE_SIZE = 9
+SECTION_SIZE = 18 * PX
+SECTION_MARGIN = 10 * PX
+LINE_HEIGHT = 1.2
+
+def css_length(value, default):
+    """Convert a CSS length such as '0.5in', '150px' or '24pt' to points (bare numbers are px)."""
+    match = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*(px|pt|in|cm|mm)?\s*", str(value or ""))
+    if not match:
+        return css_length(default, "0")
+    return float(match.group(1)) * UNITS_PT[match.group(2) or "px"]
+
+def page_size(name):
+    return PAGE_SIZES.get(str(name).strip().lower(), PAGE_SIZES["a4"])
+
+def _register_font(name, path, fallback, log):
+    """Register the TrueType font at path as name; returns fallback if it cannot be loaded."""
+    instead = f"using {fallback}" if fallback else "continuing without it"
+    if not path or not os.path.exists(path):
+        log(f"⚠️ Native PDF font {path} not found; {instead}.")
+        return fallback
+    try:
+        pdfmetrics.registerFont(TTFont(name, path))
+    except Exception as e:
+        log(f"⚠️ Could not load native PDF font {path}: {e}; {instead}.")
+        return fallback
+    return name
+
+def _load_fonts(log):
+    """Register the configured fonts once per process, logging problems to the first render's log."""
+    global FONT, FONT_BOLD, FALLBACK_FONT, _fonts_loaded
+    with _fonts_lock:
+        if not _fonts_loaded:
+            FONT = _register_font("FacesheetSans", NATIVE_PDF_FONT, "Helvetica", log)
+            FONT_BOLD = _register_font("FacesheetSans-Bold", NATIVE_PDF_FONT_BOLD, "Helvetica-Bold", log)
+            FALLBACK_FONT = _register_font("FacesheetFallback", NATIVE_PDF_FALLBACK_FONT, None, log)
+            _fonts_loaded = True
+
+def _load_image(src, log):
+    """Return an ImageReader for a data URI, file:// URI, path or URL; None if it cannot be read."""
+    if not src:
+        return None
+    try:
+        if src.startswith("data:"):
+            data = base64.b64decode(src.split(",", 1)[1])
+        else:
+            data, _ = fetch_image(src)
+        return ImageReader(io.BytesIO(data))
+    except Exception as e:
+        log(f"⚠️ Could not draw image {src[:80]}: {e}")
+        return None
+
+def _covers(font, char):
+    glyphs = getattr(getattr(pdfmetrics.getFont(font), "face", None), "charToGlyph", None)
+    if glyphs is None:
+        # A standard Type 1 font such as Helvetica: WinAnsi characters only
+        try:
+            char.encode("cp1252")
+            return True
+        except UnicodeEncodeError:
+            return False
+    return ord(char) in glyphs
+
+def _runs(text, font):
+    """Split text into (font, substring) runs, switching to FALLBACK_FONT for glyphs font lacks."""
+    runs = []
+    for char in text:
+        run_font = font
+        if FALLBACK_FONT and not _covers(font, char) and _covers(FALLBACK_FONT, char):
+            run_font = FALLBACK_FONT
+        if runs and runs[-1][0] == run_font:
+            runs[-1][1] += char
+        else:
+            runs.append([run_font, char])
+    return runs
+
+def _width(text, font, size):
+    return sum(stringWidth(run, run_font, size) for run_font, run in _runs(text, font))
+
+def _draw_centred(pdf, x, y, text, font, size):
+    runs = _runs(text, font)
+    x -= sum(stringWidth(run, run_font, size) for run_font, run in runs) / 2
+    for run_font, run in runs:
+        pdf.setFont(run_font, size)
+        pdf.drawString(x, y, run)
+        x += stringWidth(run, run_font, size)
+
+def _wrap(text, font, size, width):
+    """Greedy word wrap; words wider than the line are kept whole and clipped by the card."""
+    lines, line = [], ""
+    for word in str(text or "").split():
+        candidate = f"{line} {word}".strip()
+        if line and _width(candidate, font, size) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    if line:
+        lines.append(line)
+    return lines
+
+
+class _Layout:
+    """A top-down cursor over the pages of one PDF canvas."""
+
+    def __init__(self, pdf, page_width, page_height, top_margin, bottom_margin):
+        self.pdf = pdf
+        self.page_width = page_width
+        self.top = page_height - top_margin
+        self.bottom = bottom_margin
+        self.y = self.top
+        self.pages = 1
+
+    def new_page(self):
+        self.pdf.showPage()
+        self.y = self.top
+        self.pages += 1
+
+    def ensure(self, height):
+        if self.y - height < self.bottom and self.y < self.top:
+            self.new_page()
+
+    def centered_text(self, text, font, size, width):
+        for line in _wrap(text, font, size, width):
+            self.ensure(size * LINE_HEIGHT)
+            self.y -= size * LINE_HEIGHT
+            _draw_centred(self.pdf, self.page_width / 2, self.y + size * (LINE_HEIGHT - 1) / 2 + size * 0.2, line, font, size)
+
+
+def _draw_image_cover(pdf, image, x, y, width, height):
+    """Draw image scaled to cover the box and clipped to it, like CSS object-fit: cover."""
+    if image is None:
+        pdf.setFillColor(PLACEHOLDER_COLOR)
+        pdf.rect(x, y, width, height, stroke=0, fill=1)
+        pdf.setFillColor(black)
+        return
+    image_width, image_height = image.getSize()
+    scale = max(width / image_width, height / image_height)
+    drawn_width, drawn_height = image_width * scale, image_height * scale
+    pdf.saveState()
+    clip = pdf.beginPath()
+    clip.rect(x, y, width, height)
+    pdf.clipPath(clip, stroke=0, fill=0)
+    pdf.drawImage(image, x + (width - drawn_width) / 2, y + (height - drawn_height) / 2,
+                  drawn_width, drawn_height, mask="auto")
+    pdf.restoreState()
+
+def _draw_card(pdf, person, card, x, top, log):
+    width, height = card["width"], card["height"]
+    bottom = top - height
+
+    _draw_image_cover(
+        pdf, _load_image(person["Image File"], log),
+        x + IMAGE_PADDING, top - card["image_height"] + IMAGE_PADDING,
+        width - 2 * IMAGE_PADDING, card["image_height"] - 2 * IMAGE_PADDING
+    )
+    pdf.setLineWidth(OUTLINE)
+    pdf.line(x, top - card["image_height"], x + width, top - card["image_height"])
+
+    text_width = width - 2 * DATA_PADDING
+    y = top - card["image_height"] - DATA_OFFSET
+    for text, font, size in (
+        (person["Name"], FONT_BOLD, NAME_SIZE),
+        (person["Title"], FONT, ROLE_SIZE),
+        (person["Show"], FONT, ROLE_SIZE),
+    ):
+        for line in _wrap(text, font, size, text_width):
+            y -= size * LINE_HEIGHT
+            if y < bottom + DATA_PADDING:
+                break  # overflow: hidden
+            _draw_centred(pdf, x + width / 2, y + size * 0.2, line, font, size)
+
+    # CSS outline: drawn around the box, on top of its edges
+    pdf.rect(x - OUTLINE / 2, bottom - OUTLINE / 2, width + OUTLINE, height + OUTLINE, stroke=1, fill=0)
+
+def render_native_pdf(settings_data, grouped_people, logo_path, pdf_size, top_margin, bottom_margin, out, log=log_message):
+    """Draw the facesheet card grid directly to a PDF written to out; returns the page count.
+
+    Mirrors templates/facesheet.html: title, logo, then one page group per category with
+    140x250 cards (160x280 for 'Headline'), centred in rows. Reads the same Settings keys
+    as the template (Title, TitleFontSize, LogoWidth, LogoHeight) plus PDFSize and margins.
+    """
+    started = time.monotonic()
+    _load_fonts(log)
+    page_width, page_height = page_size(pdf_size)
+    pdf = canvas.Canvas(out, pagesize=(page_width, page_height))
+    pdf.setTitle("Face Sheet")
+    layout = _Layout(pdf, page_width, page_height, css_length(top_margin, "0.5in"), css_length(bottom_margin, "0.5in"))
+    content_width = page_width - 2 * BODY_MARGIN
+
+    layout.y -= BODY_MARGIN
+    title_size = css_length(settings_data.get("TitleFontSize"), "24pt")
+    layout.centered_text(settings_data.get("Title", ""), FONT_BOLD, title_size, content_width)
+
+    logo_width = css_length(settings_data.get("LogoWidth"), "150px")
+    logo_height = css_length(settings_data.get("LogoHeight"), "80px")
+    logo = _load_image(logo_path, log)
+    if logo is not None:
+        layout.ensure(logo_height)
+        layout.y -= logo_height
+        pdf.drawImage(logo, (page_width - logo_width) / 2, layout.y, logo_width, logo_height, mask="auto")
+    layout.y -= 10 * PX
+
+    for i, (category, people) in enumerate(grouped_people.items()):
+        if i > 0:
+            layout.new_page()  # .page-break after every category but the last
+
+        if category not in ("Headline", "N/A"):
+            layout.y -= SECTION_MARGIN
+            layout.centered_text(category, FONT_BOLD, SECTION_SIZE, content_width)
+            layout.y -= SECTION_MARGIN
+
+        card = HEADLINE_CARD if category == "Headline" else CARD
+        per_row = max(1, int(min(content_width, card["grid_width"]) // card["width"]))
+        for start in range(0, len(people), per_row):
+            row = people[start:start + per_row]
+            layout.ensure(card["height"])
+            x = (page_width - len(row) * card["width"]) / 2
+            for n, person in enumerate(row):
+                _draw_card(pdf, person, card, x + n * card["width"], layout.y, log)
+            layout.y -= card["height"]
+
+    pdf.save()
+    log(f"🖨️ Native PDF drawn: {layout.pages} pages in {time.monotonic() - started:.2f}s.")
+    return layout.pages
@@ -1,80 +1,145 @@
-import os
+import io
 import sys
-from playwright.sync_api import sync_playwright
+import pathlib
+from playwright.sync_api import sync_playwright, Error as PlaywrightError
+from pypdf import PdfWriter
 
 from logger import log_message
+from config import PDF_RENDER_MODE, PDF_RENDER_ATTEMPTS
+from browser_pool import get_browser_pool, launch_browser
+from image_readiness import wait_for_images_ready
+from jobs import stage
+from render_limiter import render_limiter
+from metrics import ACTIVE_RENDERS, PDF_RENDER_RETRIES
 
-def convert_html_to_pdf(html_in, pdf_out, pdf_size, top_margin, bottom_margin):
-    max_retries = 3
-    retry_delay = 10
-    
-    def are_all_images_loaded(page):
-        return page.evaluate("""
-            new Promise(resolve => {
-                const images = Array.from(document.querySelectorAll('img[src*="lh3.googleusercontent.com/d/"]'));
-                if (images.length === 0) {
-                    resolve(true);
-                    return;
-                }
-                let loaded = true;
-                images.forEach(img => {
-                    if (!(img.complete && img.naturalWidth > 0 && img.naturalHeight > 0)) {
-                        loaded = false;
-                    }
-                });
-                resolve(loaded);
-            });
-        """)
+def _load_html(page, html):
+    """Load an HTML string or HtmlBuffer; buffers that spilled to disk are opened by file://."""
+    if isinstance(html, str):
+        page.set_content(html, wait_until="domcontentloaded", timeout=30000)
+    elif html.path:
+        page.goto(pathlib.Path(html.path).as_uri(), wait_until="domcontentloaded", timeout=30000)
+    else:
+        page.set_content(html.getvalue(), wait_until="domcontentloaded", timeout=30000)
+
+def _render_pdf(context, html, pdf_size, top_margin, bottom_margin, log):
+    page = context.new_page()
+
+    with stage("page_load"):
+        _load_html(page, html)
+    with stage("image_wait"):
+        wait_for_images_ready(page, log=log)
+
+    with stage("page_pdf"):
+        pdf_bytes = page.pdf(
+            format=pdf_size,
+            margin={"top": top_margin, "bottom": bottom_margin}
+        )
+
+    if not pdf_bytes:
+        log("❌ PDF was not created.")
+        raise RuntimeError("PDF not created")
+    log(f"✅ PDF successfully created ({len(pdf_bytes) // 1024} KB)")
+    return pdf_bytes
+
+def _render_in_slot(context, html, pdf_size, top_margin, bottom_margin, log):
+    """_render_pdf under its own render slot, so RENDER_SLOTS counts every Chromium render."""
+    with render_limiter.slot(), ACTIVE_RENDERS.track_inprogress():
+        return _render_pdf(context, html, pdf_size, top_margin, bottom_margin, log)
+
+def _convert_once(html, pdf_size, top_margin, bottom_margin, log):
+    if PDF_RENDER_MODE == "oneshot":
+        with render_limiter.slot(), ACTIVE_RENDERS.track_inprogress(), sync_playwright() as p:
+            browser = launch_browser(p)
+            try:
+                return _render_pdf(browser.new_context(), html, pdf_size, top_margin, bottom_margin, log)
+            finally:
+                browser.close()
+    # The slot is taken on the pooled browser's thread, never while queued for one
+    return get_browser_pool().run(
+        lambda context: _render_in_slot(context, html, pdf_size, top_margin, bottom_margin, log)
+    )
+
+def _with_retries(render, log, attempts=PDF_RENDER_ATTEMPTS):
+    """Call render(), retrying browser errors (a crashed or disconnected Chromium)."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return render()
+        except PlaywrightError as e:
+            if attempt >= attempts:
+                log(f"🔥 Top-level error in PDF generation: {e}")
+                raise
+            PDF_RENDER_RETRIES.inc()
+            log(f"🔁 Browser error during PDF generation ({e}); retrying ({attempt}/{attempts - 1}).")
+        except Exception as e:
+            log(f"🔥 Top-level error in PDF generation: {e}")
+            raise
+
+def convert_html_to_pdf(html, pdf_size, top_margin, bottom_margin, ctx=None):
+    """Render an HTML string or HtmlBuffer to PDF bytes, on a pooled browser unless PDF_RENDER_MODE is 'oneshot'.
+
+    Each attempt waits for an instance-wide render slot first. Browser errors are retried up to
+    PDF_RENDER_ATTEMPTS times. Messages go to ctx's logger when called for a generation.
+    """
+    log = ctx.log if ctx else log_message
+    return _with_retries(lambda: _convert_once(html, pdf_size, top_margin, bottom_margin, log), log)
+
+def render_html_batches(htmls, pdf_size, top_margin, bottom_margin, ctx=None):
+    """Render several HTML documents in parallel, yielding their PDF bytes in order.
+
+    Every document goes to the browser pool at once, each in its own browser context
+    and under its own render slot, so they run at most BROWSER_POOL_SIZE (and RENDER_SLOTS)
+    at a time. A document that fails with a browser error is rendered again.
+    """
+    log = ctx.log if ctx else log_message
+    if PDF_RENDER_MODE == "oneshot":
+        pending = [None] * len(htmls)
+    else:
+        pool = get_browser_pool()
+        pending = [
+            pool.submit(lambda context, html=html: _render_in_slot(context, html, pdf_size, top_margin, bottom_margin, log))
+            for html in htmls
+        ]
 
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=True,
-                args=["--no-sandbox", "--disable-dev-shm-usage"]
-            )
-            page = browser.new_page()
-
-            abs_html_path = f"file://{os.path.abspath(html_in)}"
-            page.goto(abs_html_path, wait_until="load", timeout=30000)
-            page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
-            page.wait_for_timeout(1000)
-
-            for attempt in range(max_retries + 1):
-                all_loaded = are_all_images_loaded(page)
-                if all_loaded:
-                    if attempt == 0:
-                        log_message(f"✅ All Google Drive images loaded")
-                    else:
-                        log_message(f"✅ All Google Drive images loaded after {attempt} attempts.")
-                    break
-                elif attempt < max_retries:
-                    log_message(f"⚠️ Not all Google Drive images loaded. Retrying in {retry_delay} seconds (Attempt {attempt + 1}/{max_retries + 1})...")
-                    page.wait_for_timeout(retry_delay * 1000)
-                else:
-                    log_message("❌ Max retries reached. Some Google Drive images may not be loaded.")
-
-
-            abs_pdf_path = os.path.abspath(pdf_out)
-            page.pdf(
-                path=abs_pdf_path,
-                format=pdf_size,
-                margin={"top": top_margin, "bottom": bottom_margin}
-            )
-
-            if os.path.exists(abs_pdf_path):
-                log_message(f"✅ PDF successfully created at: {abs_pdf_path}")
-            else:
-                log_message("❌ PDF file was not created.")
-                raise FileNotFoundError(f"PDF not created: {abs_pdf_path}")
-
-            browser.close()
-
-    except Exception as e:
-        log_message(f"🔥 Top-level error in PDF generation: {e}")
-        raise
+        for html, future in zip(htmls, pending):
+            render = lambda html=html: _convert_once(html, pdf_size, top_margin, bottom_margin, log)
+            if future is None:
+                yield _with_retries(render, log)
+                continue
+            try:
+                pdf_bytes = pool.result(future)
+            except PlaywrightError as e:
+                PDF_RENDER_RETRIES.inc()
+                log(f"🔁 Browser error in a PDF batch ({e}); rendering it again.")
+                pdf_bytes = _with_retries(render, log, attempts=max(1, PDF_RENDER_ATTEMPTS - 1))
+            yield pdf_bytes
+    finally:
+        # A failed or abandoned batch set should not keep renders queued for the pool
+        for future in pending:
+            if future is not None:
+                future.cancel()
+
+def merge_pdfs(parts, out):
+    """Append PDFs (bytes or file paths) to out in order; bytes are dropped once appended."""
+    writer = PdfWriter()
+    for part in parts:
+        with stage("pdf_merge"):
+            writer.append(io.BytesIO(part) if isinstance(part, bytes) else part)
+    with stage("pdf_merge"):
+        writer.write(out)
+    return len(writer.pages)
+
+def convert_html_chunks_to_pdf(htmls, pdf_size, top_margin, bottom_margin, out, ctx=None):
+    """Render category-aligned HTML batches in parallel and write one merged PDF to out."""
+    log = ctx.log if ctx else log_message
+    merge_pdfs(render_html_batches(htmls, pdf_size, top_margin, bottom_margin, ctx=ctx), out)
+    log(f"📚 Merged {len(htmls)} PDF batches.")
 
 if __name__ == "__main__":
     if len(sys.argv) < 6:
         print("Usage: python your_script_name.py <html_in> <pdf_out> <pdf_size> <top_margin> <bottom_margin>")
         sys.exit(1)
-    convert_html_to_pdf(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5])
\ No newline at end of file
+    with open(sys.argv[1], encoding="utf-8") as f:
+        pdf_bytes = convert_html_to_pdf(f.read(), sys.argv[3], sys.argv[4], sys.argv[5])
+    with open(sys.argv[2], "wb") as f:
+        f.write(pdf_bytes)
@@ -0,0 +1,131 @@
+import io
+import re
+import json
+import hashlib
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, NameObject
+
+from disk_cache import DiskCache
+from render_cache import template_hash
+from config import FRAGMENT_CACHE_DIR, FRAGMENT_CACHE_MAX_MB
+
+# Bump when the way fragments are rendered changes without the template changing
+FRAGMENT_FORMAT = "2"
+
+# Link target placed at the top of each category of a multi-category batch; Chromium writes
+# it as a link annotation, which locates the category's first page and is removed on split.
+FRAGMENT_MARKER = "https://fragment.invalid/{}"
+_MARKER_PATTERN = re.compile(r"https://fragment\.invalid/(\d+)")
+
+# Rendered single-category PDFs, keyed by everything that goes into them
+fragment_cache = DiskCache(FRAGMENT_CACHE_DIR, FRAGMENT_CACHE_MAX_MB * 1024 * 1024, name="fragment")
+
+
+class Fragment:
+    """One category's pages of the facesheet; the first fragment also carries the title and logo."""
+
+    def __init__(self, category, people, header):
+        self.category = category
+        self.people = people
+        self.header = header
+        self.key = None
+        self.pdf = None
+
+    def cacheable(self, logo_path):
+        """True if every image made it into the page, so a transient download failure is never cached."""
+        srcs = [p["Image File"] for p in self.people] + ([logo_path] if self.header else [])
+        return all(src is None or src.startswith("data:") for src in srcs)
+
+
+def _load(fragment):
+    path = fragment_cache.get(fragment.key, FRAGMENT_FORMAT, ".pdf")
+    if not path:
+        return None
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None  # Evicted by another worker in between
+
+def plan_fragments(grouped_people, settings_data, page_options, logo_name, image_index):
+    """Split grouped_people into per-category fragments and load the ones already rendered.
+
+    Call before prefetch_images rewrites 'Image File'. A fragment's key covers its rows,
+    the versions of its images, the shared settings, page options and template, so any
+    change to one category only invalidates that category.
+    """
+    template = template_hash()
+    fragments = []
+    for i, (category, people) in enumerate(grouped_people.items()):
+        fragment = Fragment(category, people, header=(i == 0))
+        payload = {
+            "category": category,
+            "people": [
+                [p["Name"], p["Title"], p["Show"], image_index.version_key(p["Name"].replace(" ", "_"))]
+                for p in people
+            ],
+            "header": fragment.header,
+            "logo": image_index.version_key(logo_name) if fragment.header else None,
+            "settings": settings_data,
+            "page": page_options,
+            "template": template,
+        }
+        fragment.key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+        fragment.pdf = _load(fragment)
+        fragments.append(fragment)
+    return fragments
+
+def store_fragment(fragment, pdf_bytes, logo_path):
+    """Keep a freshly rendered fragment for this run, and in the cache when it is complete."""
+    fragment.pdf = pdf_bytes
+    if fragment.cacheable(logo_path):
+        fragment_cache.put(fragment.key, FRAGMENT_FORMAT, ".pdf", pdf_bytes)
+
+def _take_markers(page):
+    """Remove the page's fragment marker links and return the category indexes they named."""
+    annots = page.get("/Annots")
+    if annots is None:
+        return []
+    found, kept = [], ArrayObject()
+    for annot in annots.get_object():
+        action = annot.get_object().get("/A")
+        uri = action.get_object().get("/URI") if action is not None else None
+        match = _MARKER_PATTERN.fullmatch(str(uri)) if uri is not None else None
+        if match:
+            found.append(int(match.group(1)))
+        else:
+            kept.append(annot)
+    if found:
+        if kept:
+            page[NameObject("/Annots")] = kept
+        else:
+            del page["/Annots"]
+    return found
+
+def split_fragments(pdf_bytes, count):
+    """Split a batch rendered with FRAGMENT_MARKER into count per-category PDFs, markers removed.
+
+    Returns None if the markers cannot all be found in page order, so the caller can
+    render those categories one by one instead.
+    """
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    starts = {}
+    for number, page in enumerate(reader.pages):
+        for index in _take_markers(page):
+            starts.setdefault(index, number)
+
+    bounds = [starts.get(i) for i in range(count)]
+    if None in bounds or bounds[0] != 0 or any(a >= b for a, b in zip(bounds, bounds[1:])):
+        return None
+    bounds.append(len(reader.pages))
+
+    parts = []
+    for start, end in zip(bounds, bounds[1:]):
+        writer = PdfWriter()
+        for page in reader.pages[start:end]:
+            writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        parts.append(buffer.getvalue())
+    return parts
@@ -0,0 +1,112 @@
+import os
+import json
+import hashlib
+import tempfile
+
+from googleapiclient.errors import HttpError
+
+from logger import log_message
+from metrics import CACHE_HITS, CACHE_MISSES
+from config import RENDER_CACHE_DIR, TEMPLATE_DIR
+from template_helper import FACESHEET_TEMPLATE, CATEGORY_TEMPLATE
+from google_auth_helper import get_drive_service
+from images_helper import current_image_index
+
+def template_hash():
+    """Digest of the facesheet templates, so template edits invalidate cached PDFs."""
+    digest = hashlib.sha256()
+    for name in (FACESHEET_TEMPLATE, CATEGORY_TEMPLATE):
+        with open(os.path.join(TEMPLATE_DIR, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def compute_fingerprint(settings_data, grouped_people, logo_name, image_index=None):
+    """Digest of everything that ends up in the PDF: sheet values, settings, images and template.
+
+    modifiedTime is left out on purpose: it is checked by quick_cached_render, and an edit
+    that is later undone should still match the earlier render here.
+    """
+    image_index = image_index or current_image_index()
+    people = [
+        [p["Category"], p["Name"], p["Title"], p["Show"], image_index.version_key(p["Name"].replace(" ", "_"))]
+        for group in grouped_people.values()
+        for p in group
+    ]
+    payload = {
+        "settings": settings_data,
+        "people": people,
+        "logo": image_index.version_key(logo_name),
+        "template": template_hash(),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _record_path(sheet_id):
+    return os.path.join(RENDER_CACHE_DIR, f"{sheet_id}.json")
+
+def load_render_record(sheet_id):
+    try:
+        with open(_record_path(sheet_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_render_record(sheet_id, modified_time, fingerprint, file_id, pdf_link, image_index=None):
+    """Remember what a sheet's PDF was rendered from; image_index is the snapshot it used.
+
+    With modified_time and fingerprint None, only the file id is kept and nothing is reused.
+    """
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    record = {
+        "modified_time": modified_time,
+        "image_index": (image_index or current_image_index()).fingerprint,
+        "template": template_hash(),
+        "fingerprint": fingerprint,
+        "file_id": file_id,
+        "pdf_link": pdf_link,
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=RENDER_CACHE_DIR, prefix=".tmp-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(tmp_path, _record_path(sheet_id))
+
+def _pdf_still_exists(file_id):
+    try:
+        response = get_drive_service(readonly=True).files().get(
+            fileId=file_id,
+            fields="trashed",
+            supportsAllDrives=True
+        ).execute()
+        return not response.get("trashed")
+    except HttpError as e:
+        if e.resp.status == 404:
+            return False
+        raise
+
+def quick_cached_render(sheet_id, modified_time, image_index=None):
+    """Return the previous render's record if nothing it depends on can have changed.
+
+    Compares the sheet's modifiedTime, the image index and the template against the last
+    run without reading any sheet values.
+    """
+    record = load_render_record(sheet_id)
+    if (
+        record
+        and record["modified_time"] == modified_time
+        and record["image_index"] == (image_index or current_image_index()).fingerprint
+        and record["template"] == template_hash()
+        and _pdf_still_exists(record["file_id"])
+    ):
+        CACHE_HITS.labels(cache="pdf_unchanged_sheet").inc()
+        return record
+    CACHE_MISSES.labels(cache="pdf_unchanged_sheet").inc()
+    return None
+
+def cached_render(sheet_id, fingerprint):
+    """Return the previous render's record if its full fingerprint matches."""
+    record = load_render_record(sheet_id)
+    if record and record["fingerprint"] == fingerprint and _pdf_still_exists(record["file_id"]):
+        log_message("♻️ Sheet content, settings and images unchanged since the last PDF.")
+        CACHE_HITS.labels(cache="pdf_fingerprint").inc()
+        return record
+    CACHE_MISSES.labels(cache="pdf_fingerprint").inc()
+    return None
@@ -0,0 +1,172 @@
+import os
+import time
+import fcntl
+from contextlib import contextmanager
+
+from logger import log_message
+from jobs import stage
+from metrics import RENDER_QUEUE_DEPTH, RENDER_WAIT_SECONDS, RENDER_REJECTIONS
+from config import (
+    RENDER_LIMITER_DIR, RENDER_SLOTS, RENDER_QUEUE_MAX, RENDER_WAIT_TIMEOUT,
+    RENDER_MIN_FREE_MB
+)
+
+
+class RenderBusy(Exception):
+    """No render slot became free in time."""
+
+
+class _FileLock:
+    """An exclusive flock on one file; the kernel drops it if the process dies."""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+def _try_lock(path):
+    fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return _FileLock(fd)
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+        return None if value == "max" else int(value)
+    except (OSError, ValueError):
+        return None
+
+def available_memory_mb():
+    """Memory this instance can still use: the tighter of the cgroup limit and MemAvailable."""
+    candidates = []
+    for limit_path, usage_path in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),  # cgroup v2
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),  # v1
+    ):
+        limit, usage = _read_int(limit_path), _read_int(usage_path)
+        if limit is not None and usage is not None and limit < 1 << 60:
+            candidates.append((limit - usage) // (1024 * 1024))
+            break
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    candidates.append(int(line.split()[1]) // 1024)
+                    break
+    except OSError:
+        pass
+    return min(candidates) if candidates else None
+
+
+class RenderLimiter:
+    """Bounds concurrent Chromium renders across every worker process on this instance.
+
+    Render slots and queue tickets are lock files under RENDER_LIMITER_DIR. A request
+    takes a ticket when it is accepted and gives it back once it finishes; with every
+    ticket taken, new requests are turned away. A render only starts once it holds a
+    slot and the instance has RENDER_MIN_FREE_MB of memory left (or nothing else is
+    rendering).
+    """
+
+    def __init__(self, directory=RENDER_LIMITER_DIR, slots=RENDER_SLOTS, queue_max=RENDER_QUEUE_MAX,
+                 wait_timeout=RENDER_WAIT_TIMEOUT, min_free_mb=RENDER_MIN_FREE_MB):
+        self.directory = directory
+        self.slots = max(1, slots)
+        self.queue_max = max(1, queue_max)
+        self.wait_timeout = wait_timeout
+        self.min_free_mb = min_free_mb
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _slot_paths(self):
+        return [os.path.join(self.directory, f"slot-{i}") for i in range(self.slots)]
+
+    def _ticket_paths(self):
+        return [os.path.join(self.directory, f"ticket-{i}") for i in range(self.queue_max)]
+
+    def _held(self, paths):
+        held = 0
+        for path in paths:
+            lock = _try_lock(path)
+            if lock is None:
+                held += 1
+            else:
+                lock.release()
+        return held
+
+    def take_ticket(self):
+        """Reserve a place in the render queue; returns a ticket to release(), or None when full."""
+        for path in self._ticket_paths():
+            ticket = _try_lock(path)
+            if ticket is not None:
+                return ticket
+        RENDER_REJECTIONS.inc()
+        return None
+
+    def _memory_ok(self):
+        if not self.min_free_mb:
+            return True
+        free_mb = available_memory_mb()
+        if free_mb is None or free_mb >= self.min_free_mb:
+            return True
+        # Never block the only render: below the threshold we still allow one at a time.
+        return self._held(self._slot_paths()) == 0
+
+    def _try_slot(self):
+        if not self._memory_ok():
+            return None
+        for path in self._slot_paths():
+            slot = _try_lock(path)
+            if slot is not None:
+                return slot
+        return None
+
+    @contextmanager
+    def slot(self):
+        """Hold a render slot for the duration of the block, waiting up to wait_timeout for one."""
+        started = time.monotonic()
+        RENDER_QUEUE_DEPTH.inc()
+        try:
+            with stage("render_wait"):
+                delay = 0.05
+                slot = self._try_slot()
+                while slot is None:
+                    if time.monotonic() - started > self.wait_timeout:
+                        raise RenderBusy(f"no render slot free after {self.wait_timeout}s")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 1.0)
+                    slot = self._try_slot()
+        finally:
+            RENDER_QUEUE_DEPTH.dec()
+            RENDER_WAIT_SECONDS.observe(time.monotonic() - started)
+
+        waited = time.monotonic() - started
+        if waited >= 1:
+            log_message(f"⏳ Waited {waited:.1f}s for a free render slot.")
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def status(self):
+        free_mb = available_memory_mb()
+        return {
+            "slots": self.slots,
+            "rendering": self._held(self._slot_paths()),
+            "queue_max": self.queue_max,
+            "accepted": self._held(self._ticket_paths()),
+            "available_memory_mb": free_mb,
+            "min_free_mb": self.min_free_mb,
+        }
+
+
+render_limiter = RenderLimiter()
@@ -1,11 +1,17 @@
+import json
+import time
+import hashlib
+import threading
 import unicodedata
 from google_auth_helper import get_drive_service
-from images_helper import check_image_exists
+from drive_changes import get_start_page_token, list_changes
+from datetime_helper import format_datetime
 from logger import log_message
-from config import PARENT_FOLDER
+from config import PARENT_FOLDER, SHEET_LIST_TTL, SHEET_LIST_MAX_AGE
 
 def fetch_pdf_config_settings(sheet):
-    settings = sheet.worksheet("Settings").get_all_values()
+    """Read the Settings table of a SheetData into a key/value map plus the PDF page options."""
+    settings = sheet.settings_rows
     data = {row[0]: row[1] for row in settings[1:] if row[0]}
 
     pdf_size = data.get("PDFSize", "A4")
@@ -18,24 +24,24 @@ def fetch_pdf_config_settings(sheet):
 
     return data, pdf_size, top_margin, bottom_margin, logo_name
 
-def generate_grouped_people(sheet):
-    """Reads people data from the 'People' sheet and groups them by category."""
-    rows = sheet.worksheet("People").get_all_values()[1:]
+def generate_grouped_people(ctx):
+    """Reads people data from the run's 'People' sheet and groups them by category."""
+    rows = [r for r in ctx.sheet.people_rows[1:] if any(cell.strip() for cell in r)]
+
+    # Resolve every headshot against the run's image index snapshot in one pass
+    images = ctx.image_index.resolve(
+        [r[1].replace(" ", "_") for r in rows], stats=ctx.image_stats, log=ctx.log
+    )
+
     people = []
     for r in rows:
-        if not any(cell.strip() for cell in r):
-            continue
         name = r[1]
-        
-        # Using check_image_exists to get the image URL directly from Google Drive
-        img = check_image_exists(name.replace(" ", "_"))  # No need for fallback here
-        
         people.append({
             "Category": r[0],
             "Name": name,
             "Title": r[2],
             "Show": r[3] if len(r) > 3 else "",
-            "Image File": img
+            "Image File": images[name.replace(" ", "_")]
         })
 
     # Group people by category
@@ -45,15 +51,77 @@ def generate_grouped_people(sheet):
     
     return grouped
 
-def list_google_sheets():
-    try:
-        drive_service = get_drive_service()
+# === Sheet listing cache ===
+SPREADSHEET_MIME = "application/vnd.google-apps.spreadsheet"
+
+_listing_lock = threading.Lock()
+_listing = {"rows": None, "etag": None, "built_at": 0.0, "checked_at": 0.0, "changes_token": None}
+
+def _fetch_sheet_rows(drive_service):
+    rows = []
+    page_token = None
+    while True:
         response = drive_service.files().list(
-            q=f"'{PARENT_FOLDER}' in parents and mimeType='application/vnd.google-apps.spreadsheet' and trashed=false",
-            fields="files(id, name, modifiedTime)",
-            orderBy="modifiedTime desc"
+            q=f"'{PARENT_FOLDER}' in parents and mimeType='{SPREADSHEET_MIME}' and trashed=false",
+            fields="nextPageToken, files(id, name, modifiedTime)",
+            orderBy="modifiedTime desc",
+            pageSize=1000,
+            pageToken=page_token
         ).execute()
-        return response.get("files", [])
-    except Exception as e:
-        log_message(f"❌ Failed to list sheets: {e}")
-        return []
+        for f in response.get("files", []):
+            f["modifiedTimeDisplay"] = format_datetime(f["modifiedTime"])
+            rows.append(f)
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return rows
+
+def _rebuild_listing(drive_service):
+    changes_token = get_start_page_token(drive_service)
+    rows = _fetch_sheet_rows(drive_service)
+    now = time.time()
+    _listing.update(
+        rows=rows,
+        etag=hashlib.sha256(json.dumps(rows, sort_keys=True).encode("utf-8")).hexdigest(),
+        built_at=now,
+        checked_at=now,
+        changes_token=changes_token
+    )
+
+def _listing_changed(drive_service):
+    """Check the Drive changes feed for anything that could affect the sheet list."""
+    changes, new_token = list_changes(drive_service, _listing["changes_token"], "id, parents, mimeType")
+    known_ids = {row["id"] for row in _listing["rows"]}
+    changed = any(
+        change["fileId"] in known_ids
+        or (
+            change.get("file")
+            and change["file"].get("mimeType") == SPREADSHEET_MIME
+            and PARENT_FOLDER in change["file"].get("parents", [])
+        )
+        for change in changes
+    )
+    _listing.update(changes_token=new_token, checked_at=time.time())
+    return changed
+
+def get_sheet_listing():
+    """Return (rows, etag) for the sheets in the parent folder, served from a shared cache.
+
+    The cache checks the Drive changes feed at most every SHEET_LIST_TTL seconds and is
+    rebuilt when something relevant changed, or after SHEET_LIST_MAX_AGE regardless.
+    """
+    with _listing_lock:
+        now = time.time()
+        try:
+            drive_service = get_drive_service(readonly=True)
+            if _listing["rows"] is None or now - _listing["built_at"] > SHEET_LIST_MAX_AGE:
+                _rebuild_listing(drive_service)
+            elif now - _listing["checked_at"] > SHEET_LIST_TTL and _listing_changed(drive_service):
+                _rebuild_listing(drive_service)
+        except Exception as e:
+            log_message(f"❌ Failed to list sheets: {e}")
+            if _listing["rows"] is None:
+                return [], None
+        return _listing["rows"], _listing["etag"]
+
+def list_google_sheets():
+    return get_sheet_listing()[0]
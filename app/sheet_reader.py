@@ -0,0 +1,77 @@
+import os
+import json
+
+from google_auth_helper import get_drive_service, get_sheets_service
+from config import SHEET_READER
+
+# Only the columns the facesheet uses: Settings key/value and People Category/Name/Title/Show
+SETTINGS_RANGE = "Settings!A:B"
+PEOPLE_RANGE = "People!A:D"
+SETTINGS_WIDTH = 2
+PEOPLE_WIDTH = 4
+
+def _pad_rows(rows, width):
+    # The Sheets API drops trailing empty cells; pad so rows index like get_all_values().
+    return [row + [""] * (width - len(row)) for row in rows]
+
+
+class SheetData:
+    """The parts of a facesheet spreadsheet the generator needs, header rows included."""
+
+    def __init__(self, sheet_id, title, modified_time, settings_rows=None, people_rows=None):
+        self.id = sheet_id
+        self.title = title
+        self.modified_time = modified_time
+        self.settings_rows = settings_rows
+        self.people_rows = people_rows
+
+
+class GoogleSheetReader:
+    """Reads sheet metadata with one Drive call and both tables with one values:batchGet."""
+
+    def read_metadata(self, sheet_id):
+        response = get_drive_service(readonly=True).files().get(
+            fileId=sheet_id,
+            fields="name, modifiedTime",
+            supportsAllDrives=True
+        ).execute()
+        return SheetData(sheet_id, response["name"], response["modifiedTime"])
+
+    def read_tables(self, sheet):
+        response = get_sheets_service().spreadsheets().values().batchGet(
+            spreadsheetId=sheet.id,
+            ranges=[SETTINGS_RANGE, PEOPLE_RANGE],
+            majorDimension="ROWS"
+        ).execute()
+        settings, people = (r.get("values", []) for r in response["valueRanges"])
+        sheet.settings_rows = _pad_rows(settings, SETTINGS_WIDTH)
+        sheet.people_rows = _pad_rows(people, PEOPLE_WIDTH)
+        return sheet
+
+
+class LocalSheetReader:
+    """Reads <directory>/<sheet_id>.json fixtures: {"title", "modifiedTime", "Settings": [...], "People": [...]}."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _load(self, sheet_id):
+        with open(os.path.join(self.directory, f"{sheet_id}.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def read_metadata(self, sheet_id):
+        fixture = self._load(sheet_id)
+        return SheetData(sheet_id, fixture["title"], fixture["modifiedTime"])
+
+    def read_tables(self, sheet):
+        fixture = self._load(sheet.id)
+        sheet.settings_rows = _pad_rows(fixture["Settings"], SETTINGS_WIDTH)
+        sheet.people_rows = _pad_rows(fixture["People"], PEOPLE_WIDTH)
+        return sheet
+
+
+def get_sheet_reader():
+    """Return the reader selected by SHEET_READER."""
+    if SHEET_READER.startswith("local:"):
+        return LocalSheetReader(SHEET_READER[len("local:"):])
+    return GoogleSheetReader()
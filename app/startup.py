@@ -0,0 +1,20 @@
+import time
+
+from logger import log_message
+from google_auth_helper import warm_discovery_docs
+from template_helper import template_env, check_templates, FACESHEET_TEMPLATE, CATEGORY_TEMPLATE
+
+def warm_up():
+    """Do the start-up work that is safe to share across forked workers.
+
+    Under gunicorn --preload this runs once in the master, so every worker starts with
+    the modules imported, discovery documents parsed and templates compiled and
+    test-rendered. Nothing here opens a network connection or starts a thread that a
+    fork would break.
+    """
+    started = time.perf_counter()
+    warm_discovery_docs()
+    template_env.get_template(FACESHEET_TEMPLATE)
+    template_env.get_template(CATEGORY_TEMPLATE)
+    check_templates()
+    log_message(f"🔥 Warm-up finished in {round(time.perf_counter() - started, 3)}s.")
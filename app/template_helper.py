@@ -0,0 +1,107 @@
+import io
+import os
+import tempfile
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+from logger import log_message
+from config import IS_PRODUCTION, TEMPLATE_DIR, TEMPLATE_CACHE_DIR, HTML_SPOOL_THRESHOLD_MB
+
+FACESHEET_TEMPLATE = "facesheet.html"
+CATEGORY_TEMPLATE = "facesheet_category.html"
+
+# One environment per process: templates are parsed once, compiled bytecode is shared on disk
+# between workers, and files are only re-checked for edits outside production.
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+template_env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    auto_reload=not IS_PRODUCTION,
+    bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+)
+
+
+class HtmlBuffer:
+    """Collects streamed HTML in memory, moving it to a temp file once it passes max_size."""
+
+    def __init__(self, max_size=HTML_SPOOL_THRESHOLD_MB * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self.path = None
+        self._memory = io.StringIO()
+        self._file = None
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self._file is None and self.size > self.max_size:
+            self._file = tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".html", delete=False)
+            self.path = self._file.name
+            self._file.write(self._memory.getvalue())
+            self._memory = None
+        (self._file or self._memory).write(chunk)
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+        return self
+
+    def getvalue(self):
+        if self.path:
+            with open(self.path, encoding="utf-8") as f:
+                return f.read()
+        return self._memory.getvalue()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            os.remove(self.path)
+            self._file = None
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def chunk_categories(grouped_people, max_people):
+    """Split grouped_people into consecutive batches of whole categories, about max_people each.
+
+    Every category starts a new page, so batches can be rendered separately and their
+    PDFs joined in order. A category larger than max_people gets a batch of its own.
+    """
+    if not max_people:
+        return [grouped_people]
+    chunks, current, size = [], {}, 0
+    for category, people in grouped_people.items():
+        if current and size + len(people) > max_people:
+            chunks.append(current)
+            current, size = {}, 0
+        current[category] = people
+        size += len(people)
+    if current or not chunks:
+        chunks.append(current)
+    return chunks
+
+def check_templates():
+    """Render a two-category sample and log any error, so a broken template shows up at start-up."""
+    person = {"Name": "Sample Person", "Title": "Role", "Show": "Show", "Image File": None}
+    try:
+        render_facesheet(
+            settings_data={"Title": "Sample"},
+            grouped_people={"Headline": [person], "Cast": [person]},
+            email="",
+            logo_path=None
+        ).close()
+    except Exception as e:
+        log_message(f"⚠️ The facesheet template failed to render a sample roster: {e}")
+
+def render_facesheet(show_header=True, **context):
+    """Stream the facesheet template, one category section at a time, into an HtmlBuffer.
+
+    show_header=False leaves out the title and logo, for batches after the first.
+    """
+    buffer = HtmlBuffer()
+    for chunk in template_env.get_template(FACESHEET_TEMPLATE).generate(show_header=show_header, **context):
+        buffer.write(chunk)
+    return buffer.finish()
@@ -1,36 +1,96 @@
-from googleapiclient.http import MediaFileUpload
+import os
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 from logger import log_message
 from google_auth_helper import get_drive_service
+from config import SIMPLE_UPLOAD_MAX_MB
 
-drive_service = get_drive_service()
+RESUMABLE_CHUNK_SIZE = 25 * 1024 * 1024
 
-def upload_or_replace_file(file_path, filename, parent_id, mime_type="application/pdf"):
-    """Uploads a file to Drive, replacing the old one if it exists."""
+def _media(stream, mime_type):
+    """Multipart upload for small payloads (one request); resumable only for large ones."""
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size > SIMPLE_UPLOAD_MAX_MB * 1024 * 1024:
+        return MediaIoBaseUpload(stream, mimetype=mime_type, resumable=True, chunksize=RESUMABLE_CHUNK_SIZE)
+    return MediaIoBaseUpload(stream, mimetype=mime_type, resumable=False)
+
+def _update_file(drive_service, file_id, stream, filename, mime_type):
+    """Upload a new revision of an existing file (restoring it from the trash if needed)."""
+    return drive_service.files().update(
+        fileId=file_id,
+        body={'name': filename, 'trashed': False},
+        media_body=_media(stream, mime_type),
+        fields='id',
+        supportsAllDrives=True
+    ).execute()
+
+def _delete_files(drive_service, file_ids, filename, log):
+    """Delete duplicates in one batched HTTP request."""
+    def on_deleted(request_id, response, exception):
+        if exception:
+            log(f"⚠️ Failed to delete {filename}: {exception}")
+        else:
+            log(f"🗑️ Deleted duplicate {filename}")
+
+    batch = drive_service.new_batch_http_request(callback=on_deleted)
+    for file_id in file_ids:
+        batch.add(drive_service.files().delete(fileId=file_id, supportsAllDrives=True))
+    batch.execute()
+
+def upload_or_replace_file(stream, filename, parent_id, mime_type="application/pdf", file_id=None, ctx=None):
+    """Uploads a file-like object to Drive as a new revision of the sheet's existing PDF.
+
+    file_id is the PDF this sheet was uploaded to last time; updating it keeps the Drive
+    link stable. Without one (or if it is gone), an existing file with the same name is
+    adopted, and only when there is none is a new file created. Messages go to ctx's
+    logger when called for a generation.
+    """
+    log = ctx.log if ctx else log_message
     try:
+        drive_service = get_drive_service()
+
+        if file_id:
+            try:
+                upload = _update_file(drive_service, file_id, stream, filename, mime_type)
+                log("✅ Uploaded new revision of existing PDF")
+                return upload['id'], f"https://drive.google.com/file/d/{upload['id']}/view"
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                log("⚠️ Previous PDF no longer exists; looking for one by name.")
+
+        escaped_name = filename.replace("\\", "\\\\").replace("'", "\\'")
         existing = drive_service.files().list(
-            q=f"'{parent_id}' in parents and name='{filename}' and trashed=false",
-            fields="files(id)"
+            q=f"'{parent_id}' in parents and name='{escaped_name}' and trashed=false",
+            fields="files(id)",
+            orderBy="modifiedTime desc",
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True
         ).execute().get('files', [])
 
-        for f in existing:
-            try:
-                drive_service.files().delete(fileId=f['id']).execute()
-                log_message(f"🗑️ Deleted old {filename}")
-            except Exception as e:
-                log_message(f"⚠️ Failed to delete {filename}: {e}")
-
-        metadata = {
-            'name': filename,
-            'parents': [parent_id],
-            'mimeType': mime_type
-        }
-        media = MediaFileUpload(file_path, mimetype=mime_type, resumable=True, chunksize=25 * 1024 * 1024)
-        upload = drive_service.files().create(body=metadata, media_body=media, fields='id').execute()
+        if existing:
+            upload = _update_file(drive_service, existing[0]['id'], stream, filename, mime_type)
+            if len(existing) > 1:
+                _delete_files(drive_service, [f['id'] for f in existing[1:]], filename, log)
+        else:
+            metadata = {
+                'name': filename,
+                'parents': [parent_id],
+                'mimeType': mime_type
+            }
+            upload = drive_service.files().create(
+                body=metadata,
+                media_body=_media(stream, mime_type),
+                fields='id',
+                supportsAllDrives=True
+            ).execute()
 
         file_link = f"https://drive.google.com/file/d/{upload['id']}/view"
-        log_message(f"✅ Uploaded file")
+        log(f"✅ Uploaded file")
         return upload['id'], file_link
 
     except Exception as e:
-        log_message(f"❌ Upload error: {e}")
-        return None, None
\ No newline at end of file
+        log(f"❌ Upload error: {e}")
+        return None, None
@@ -0,0 +1,418 @@
+"""Run facesheet.generate end to end offline and compare it against a saved baseline.
+
+Sheets are read from generated LocalSheetReader fixtures, Drive calls go to an in-memory
+stand-in, and headshots are served by a local HTTP server, so only our own code (and
+Chromium) is measured. Each roster size runs in a fresh interpreter. Run from the
+repository root:
+
+    python benchmarks/pipeline_benchmark.py [--sizes 10,100,1000,10000] [--runs 1]
+    python benchmarks/pipeline_benchmark.py --save-baseline     # record the current numbers
+    python benchmarks/pipeline_benchmark.py                     # exits 1 on a regression
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import struct
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "pipeline_baseline.json")
+
+DEFAULT_SIZES = "10,100,1000,10000"
+PARENT_FOLDER_ID = "bench-parent"
+IMAGES_FOLDER_ID = "bench-images"
+SHEET_ID = "bench-sheet"
+IMAGE_VARIANTS = 64
+MISSING_IMAGE_EVERY = 50  # one person in 50 has no headshot, to exercise the miss path
+
+
+# === Synthetic data ===
+def _png(width, height, seed):
+    """A small RGB PNG with a per-seed gradient, so variants differ but stay cheap to build."""
+    rows = []
+    for y in range(height):
+        row = bytearray([0])
+        for x in range(width):
+            row += bytes(((x * 255 // width + seed * 37) % 256, (y * 255 // height + seed * 91) % 256, (seed * 53) % 256))
+        rows.append(bytes(row))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) + chunk(b"IEND", b"")
+
+def build_roster(size, categories):
+    """Sheet fixture plus Drive image metadata for a synthetic roster."""
+    people = [["Category", "Name", "Title", "Show"]]
+    images = {}
+    for i in range(size):
+        name = f"Person {i:05d}"
+        people.append([f"Category {i % categories:03d}", name, f"Role {i % 17}", f"Show {i % 5}"])
+        if i % MISSING_IMAGE_EVERY != MISSING_IMAGE_EVERY - 1:
+            file_id = f"img-{i:05d}"
+            images[file_id] = {
+                "id": file_id,
+                "name": f"{name.replace(' ', '_')}.png",
+                "parents": [IMAGES_FOLDER_ID],
+                "trashed": False,
+                "md5Checksum": f"v{i % IMAGE_VARIANTS}",
+                "modifiedTime": "2024-01-01T00:00:00.000Z",
+            }
+    images["img-logo"] = {
+        "id": "img-logo",
+        "name": "logo.png",
+        "parents": [IMAGES_FOLDER_ID],
+        "trashed": False,
+        "md5Checksum": "logo",
+        "modifiedTime": "2024-01-01T00:00:00.000Z",
+    }
+    fixture = {
+        "title": f"Benchmark {size}",
+        "modifiedTime": "2024-01-01T00:00:00.000Z",
+        "Settings": [
+            ["Key", "Value"],
+            ["Title", f"Benchmark roster ({size} people)"],
+            ["PDFSize", "A4"],
+            ["LogoName", "logo.png"],
+        ],
+        "People": people,
+    }
+    return fixture, images
+
+
+# === Local stand-ins ===
+class _ImageHandler(BaseHTTPRequestHandler):
+    variants = []
+
+    def do_GET(self):
+        file_id = self.path.strip("/").split("?")[0]
+        seed = sum(file_id.encode("utf-8")) % len(self.variants)
+        body = self.variants[seed]
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_image_server():
+    _ImageHandler.variants = [_png(160, 200, seed) for seed in range(IMAGE_VARIANTS)]
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class _Request:
+    def __init__(self, result):
+        self._result = result
+
+    def execute(self):
+        return self._result() if callable(self._result) else self._result
+
+
+class _Batch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request):
+        self.requests.append(request)
+
+    def execute(self):
+        for n, request in enumerate(self.requests):
+            self.callback(str(n), request.execute(), None)
+
+
+class FakeDrive:
+    """Answers the Drive v3 calls the pipeline makes from in-memory state."""
+
+    def __init__(self, images):
+        self.images = images
+        self.uploads = {}
+        self.uploaded_bytes = 0
+
+    def files(self):
+        return self
+
+    def changes(self):
+        return self
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(callback)
+
+    def getStartPageToken(self, **kwargs):
+        return _Request({"startPageToken": "1"})
+
+    def list(self, q=None, pageToken=None, **kwargs):
+        if q is None:  # changes().list
+            return _Request({"changes": [], "newStartPageToken": "1"})
+        if "name='images'" in q:
+            return _Request({"files": [{"id": IMAGES_FOLDER_ID}]})
+        if f"'{IMAGES_FOLDER_ID}' in parents" in q:
+            return _Request({"files": list(self.images.values())})
+        return _Request({"files": [{"id": f} for f, meta in self.uploads.items() if f"name='{meta['name']}'" in q]})
+
+    def get(self, fileId=None, **kwargs):
+        return _Request({"id": fileId, "trashed": fileId not in self.uploads})
+
+    def _store(self, file_id, body, media_body):
+        data = media_body.getbytes(0, media_body.size())
+        self.uploaded_bytes = len(data)
+        self.uploads[file_id] = {"name": body["name"], "size": len(data)}
+        return {"id": file_id}
+
+    def create(self, body=None, media_body=None, **kwargs):
+        file_id = f"pdf-{len(self.uploads) + 1}"
+        return _Request(lambda: self._store(file_id, body, media_body))
+
+    def update(self, fileId=None, body=None, media_body=None, **kwargs):
+        return _Request(lambda: self._store(fileId, body, media_body))
+
+    def delete(self, fileId=None, **kwargs):
+        return _Request(lambda: self.uploads.pop(fileId, None))
+
+
+# === Child process: one roster size ===
+class _PeakRss:
+    """Samples this process plus its browser children, keeping the maximum."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        from browser_pool import browser_rss_mb
+
+        def sample():
+            while not self._stop.is_set():
+                self.peak = max(self.peak, browser_rss_mb(os.getpid()))
+                self._stop.wait(self.interval)
+
+        self._thread = threading.Thread(target=sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def run_child(size, categories, runs, out_path):
+    sys.path.insert(0, APP_DIR)
+    work_dir = os.environ["STATE_DIR"]
+    fixture, images = build_roster(size, categories)
+    fixture_dir = os.path.join(work_dir, "sheets")
+    os.makedirs(fixture_dir, exist_ok=True)
+    with open(os.path.join(fixture_dir, f"{SHEET_ID}.json"), "w", encoding="utf-8") as f:
+        json.dump(fixture, f)
+
+    import jobs
+    import facesheet
+    from image_cache import image_cache
+    from pdf_fragments import fragment_cache
+
+    drive = FakeDrive(images)
+    for module in list(sys.modules.values()):
+        if getattr(module, "get_drive_service", None) is not None and getattr(module, "__file__", "").startswith(APP_DIR):
+            module.get_drive_service = lambda readonly=False: drive
+
+    results = []
+    for _ in range(runs):
+        # Every run starts with cold image and fragment caches so runs are comparable.
+        for cache in (image_cache, fragment_cache):
+            shutil.rmtree(cache.directory, ignore_errors=True)
+            os.makedirs(cache.directory, exist_ok=True)
+
+        job = jobs.Job("bench@example.com", SHEET_ID, force=True)
+        os.makedirs(jobs.JOB_DIR, exist_ok=True)
+        token = jobs._current_job.set(job)
+        try:
+            with _PeakRss() as rss:
+                started = time.perf_counter()
+                payload = facesheet.generate(job.email, SHEET_ID, force=True)
+                total = time.perf_counter() - started
+        finally:
+            jobs._current_job.reset(token)
+
+        if payload.get("result") != "Success":
+            # Leave the reason where the parent can read it, even when stderr is not captured.
+            error = payload.get("error", "generation failed")
+            with open(out_path, "w", encoding="utf-8") as f:
+                json.dump({"error": error}, f)
+            raise RuntimeError(error)
+        results.append({
+            "total_seconds": round(total, 3),
+            "stages": dict(job.timings),
+            "peak_rss_mb": rss.peak,
+            "pdf_bytes": drive.uploaded_bytes,
+        })
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(results, f)
+
+
+# === Parent: orchestrate, report, compare ===
+def _median_result(results):
+    stages = sorted({name for r in results for name in r["stages"]})
+    return {
+        "total_seconds": round(statistics.median(r["total_seconds"] for r in results), 3),
+        "stages": {name: round(statistics.median(r["stages"].get(name, 0) for r in results), 3) for name in stages},
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in results),
+        "pdf_bytes": int(statistics.median(r["pdf_bytes"] for r in results)),
+    }
+
+def measure(size, categories, runs, verbose):
+    with tempfile.TemporaryDirectory(prefix="facesheet-bench-") as work_dir:
+        # Run inside the scratch directory so log.jsonl and friends stay out of the repository.
+        os.symlink(os.path.join(ROOT, "templates"), os.path.join(work_dir, "templates"))
+        server = start_image_server()
+        out_path = os.path.join(work_dir, "result.json")
+        env = {
+            **os.environ,
+            "ENVIRONMENT": "production",
+            "PARENT_FOLDER": PARENT_FOLDER_ID,
+            "STATE_DIR": work_dir,
+            "IMAGE_CACHE_DIR": os.path.join(work_dir, "image-cache"),
+            "SHEET_READER": f"local:{os.path.join(work_dir, 'sheets')}",
+            "IMAGE_URL_TEMPLATE": f"http://127.0.0.1:{server.server_port}/{{file_id}}",
+            "STARTUP_WARMUP": "0",
+        }
+        try:
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", str(size),
+                 "--categories", str(categories), "--runs", str(runs), "--out", out_path],
+                cwd=work_dir,
+                env=env,
+                capture_output=not verbose,
+                text=True,
+            )
+        finally:
+            server.shutdown()
+        written = None
+        if os.path.exists(out_path):
+            with open(out_path, encoding="utf-8") as f:
+                written = json.load(f)
+        if result.returncode != 0:
+            if isinstance(written, dict) and "error" in written:
+                raise RuntimeError(written["error"])
+            stderr = (result.stderr or "").strip().splitlines()
+            raise RuntimeError(stderr[-1] if stderr else f"child exited with code {result.returncode}")
+        return _median_result(written)
+
+def compare(current, baseline, tolerance, min_seconds, min_rss_mb):
+    """Return a list of human-readable regressions of current against baseline.
+
+    A size that failed to run, or that is in the baseline but was not run, is a regression.
+    """
+    regressions = []
+
+    def check(label, now, before, slack):
+        if before is not None and now > before * (1 + tolerance) and now - before > slack:
+            regressions.append(f"{label}: {before} -> {now}")
+
+    for size in baseline:
+        if size not in current:
+            regressions.append(f"{size} people: in the baseline but not run")
+
+    for size, result in current.items():
+        if not isinstance(result, dict):
+            regressions.append(f"{size} people: {result}")
+            continue
+        base = baseline.get(size)
+        if not isinstance(base, dict):
+            continue
+        check(f"{size} people total_seconds", result["total_seconds"], base["total_seconds"], min_seconds)
+        for name, seconds in result["stages"].items():
+            check(f"{size} people stage {name}", seconds, base["stages"].get(name), min_seconds)
+        check(f"{size} people peak_rss_mb", result["peak_rss_mb"], base["peak_rss_mb"], min_rss_mb)
+        check(f"{size} people pdf_bytes", result["pdf_bytes"], base["pdf_bytes"], 0)
+    return regressions
+
+def print_report(report):
+    for size, result in report.items():
+        print(f"\n📄 {size} people")
+        if not isinstance(result, dict):
+            print(f"  {result}")
+            continue
+        for name, seconds in result["stages"].items():
+            print(f"  {name:<20} {seconds * 1000:10.1f} ms")
+        print(f"  {'total':<20} {result['total_seconds'] * 1000:10.1f} ms")
+        print(f"  {'peak RSS':<20} {result['peak_rss_mb']:10d} MB")
+        print(f"  {'PDF size':<20} {result['pdf_bytes'] / 1024:10.1f} KB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated roster sizes")
+    parser.add_argument("--people-per-category", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=1, help="runs per size; the median is reported")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown before failing")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore time regressions smaller than this")
+    parser.add_argument("--min-rss-mb", type=int, default=32, help="ignore memory regressions smaller than this")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own log output")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--categories", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child, args.categories, args.runs, args.out)
+        return
+
+    report = {}
+    for size in (int(s) for s in args.sizes.split(",")):
+        categories = max(1, size // args.people_per_category)
+        try:
+            report[str(size)] = measure(size, categories, args.runs, args.verbose)
+        except RuntimeError as e:
+            report[str(size)] = f"error: {e}"
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failed = [size for size, result in report.items() if not isinstance(result, dict)]
+
+    if args.save_baseline:
+        if failed:
+            print(f"\n❌ Not saving a baseline: {', '.join(failed)} people failed.")
+            sys.exit(1)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        if failed:
+            print(f"\n❌ Generation failed for {', '.join(failed)} people.")
+            sys.exit(1)
+        print("\nℹ️ No baseline yet; run with --save-baseline to record one.")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance, args.min_seconds, args.min_rss_mb)
+    if regressions:
+        print("\n❌ Regressions against baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\n✅ No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
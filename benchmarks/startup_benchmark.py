@@ -0,0 +1,109 @@
+"""Measure worker start-up cost: import time per app module and first-request latency.
+
+Each measurement runs in a fresh interpreter so module caches from earlier runs do not hide
+import work. Run from the repository root:
+
+    python benchmarks/startup_benchmark.py [--runs 3] [--json]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+
+MODULES = [
+    "config",
+    "logger",
+    "google_auth_helper",
+    "images_helper",
+    "upload_delete",
+    "sheet",
+    "pdf",
+    "facesheet",
+    "app",
+]
+
+IMPORT_SNIPPET = """
+import sys, time, json
+sys.path.insert(0, {app_dir!r})
+started = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - started}}))
+"""
+
+REQUEST_SNIPPET = """
+import sys, time, json
+sys.path.insert(0, {app_dir!r})
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+client = app.test_client()
+first = time.perf_counter()
+client.get("/login")
+second = time.perf_counter()
+client.get("/login")
+done = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - started,
+    "first_request_seconds": second - first,
+    "second_request_seconds": done - second,
+}}))
+"""
+
+def _run(snippet):
+    result = subprocess.run(
+        [sys.executable, "-c", snippet],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    report = {"imports": {}, "first_request": None}
+    for module in MODULES:
+        try:
+            samples = [_run(IMPORT_SNIPPET.format(app_dir=APP_DIR, module=module))["seconds"] for _ in range(args.runs)]
+            report["imports"][module] = round(statistics.median(samples), 4)
+        except RuntimeError as e:
+            report["imports"][module] = f"error: {e}"
+
+    try:
+        samples = [_run(REQUEST_SNIPPET.format(app_dir=APP_DIR)) for _ in range(args.runs)]
+        report["first_request"] = {
+            key: round(statistics.median(s[key] for s in samples), 4)
+            for key in samples[0]
+        }
+    except RuntimeError as e:
+        report["first_request"] = f"error: {e}"
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print("⏱️  Import time per module (cumulative, median of fresh interpreters)")
+    for module, seconds in report["imports"].items():
+        value = f"{seconds * 1000:8.1f} ms" if isinstance(seconds, float) else seconds
+        print(f"  {module:<20} {value}")
+
+    print("\n🌐 First request (/login) after import")
+    if isinstance(report["first_request"], dict):
+        for key, seconds in report["first_request"].items():
+            print(f"  {key:<24} {seconds * 1000:8.1f} ms")
+    else:
+        print(f"  {report['first_request']}")
+
+if __name__ == "__main__":
+    main()
@@ -70,6 +70,10 @@ def build_push_and_deploy(env_vars):
         f"--project {project_id} "
         f"--memory 4G "
         f"--cpu 2 "
+        # Jobs run on background threads after /generate returns and keep their state in the
+        # instance's /tmp, so CPU must stay allocated and a browser must keep hitting one instance.
+        f"--no-cpu-throttling "
+        f"--session-affinity "
         f"--service-account {env_vars['SERVICE_ACCOUNT_EMAIL']} "
         f"--env-vars-file={os.path.join(DEPLOY_DIR, 'env.yaml')}"
     )